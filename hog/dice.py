@@ -12,13 +12,104 @@ Types of dice:
     cycle among a fixed set of values when rolled.
 """
 
-from random import randint
+import os
+import weakref
+from fractions import Fraction
+from random import Random
+
+BLOCK_SIZE = 4096  # Most random bytes drawn at a time for each fair die
+FIRST_BLOCK_SIZE = 32  # Random bytes drawn first after a die is seeded
+
+_random = Random()
+_fair_dice = weakref.WeakSet()
+
+def seed(a=None):
+    """Seed the random numbers of every fair die with A, or from the
+    operating system if A is None, discarding outcomes already drawn.
+
+    >>> seed(61)
+    >>> rolls = [six_sided() for _ in range(5)]
+    >>> seed(61)
+    >>> rolls == [six_sided() for _ in range(5)]
+    True
+    """
+    _random.seed(a)
+    for dice in _fair_dice:
+        dice.reset()
+
+def _seed_after_fork():
+    """Seed the dice of a forked child process afresh, so that it does not
+    roll the same outcomes as its parent and its siblings.
+
+    >>> def child_rolls():
+    ...     read, write = os.pipe()
+    ...     pid = os.fork()
+    ...     if pid == 0:
+    ...         os.write(write, bytes(six_sided() for _ in range(20)))
+    ...         os._exit(0)
+    ...     os.close(write)
+    ...     os.waitpid(pid, 0)
+    ...     with os.fdopen(read, 'rb') as f:
+    ...         return f.read()
+    >>> seed(61)
+    >>> len({child_rolls() for _ in range(3)})
+    3
+    """
+    seed(None)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_seed_after_fork)
+
+def _block_tables(sides):
+    """Return a translation table that maps each random byte to an outcome
+    from 1 to SIDES, and the bytes to delete first because they would make
+    some outcome more likely than the others."""
+    limit = 256 - 256 % sides
+    table = bytes(b % sides + 1 if b < limit else 0 for b in range(256))
+    return table, bytes(range(limit, 256))
 
 def make_fair_dice(sides):
-    """Return a die that returns 1 to SIDES with equal chance."""
+    """Return a die that returns 1 to SIDES with equal chance.  Its number of
+    sides is available as its sides attribute.
+
+    Dice with up to 256 sides draw outcomes in blocks of random bytes and serve
+    them from a buffer.  Each byte that maps to an outcome gives one roll, so
+    the die keeps the distribution exactly uniform.  The first block after
+    the die is made or seeded has FIRST_BLOCK_SIZE bytes, and each block after
+    that is twice as long, up to BLOCK_SIZE, so that games seeded one by one
+    draw few bytes they do not use.  Larger dice draw each outcome separately.
+    The pmf method returns the exact distribution.
+
+    >>> make_fair_dice(4).sides
+    4
+    >>> make_fair_dice(2).pmf()
+    {1: Fraction(1, 2), 2: Fraction(1, 2)}
+    >>> 1 <= make_fair_dice(1000)() <= 1000
+    True
+    """
     assert type(sides) == int and sides >= 1, 'Illegal value for sides'
-    def dice():
-        return randint(1,sides)
+    if sides > 256:
+        def dice():
+            return _random.randrange(sides) + 1
+        def reset():
+            pass
+    else:
+        table, rejected = _block_tables(sides)
+        outcomes, size = iter(()), FIRST_BLOCK_SIZE
+        def dice():
+            nonlocal outcomes, size
+            while True:
+                for outcome in outcomes:
+                    return outcome
+                block = _random.randbytes(size).translate(table, rejected)
+                outcomes, size = iter(block), min(2 * size, BLOCK_SIZE)
+        def reset():
+            nonlocal outcomes, size
+            outcomes, size = iter(()), FIRST_BLOCK_SIZE
+    def pmf():
+        return {outcome: Fraction(1, sides) for outcome in range(1, sides + 1)}
+    dice.sides, dice.reset, dice.pmf = sides, reset, pmf
+    _fair_dice.add(dice)
     return dice
 
 four_sided = make_fair_dice(4)
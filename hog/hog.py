@@ -1,5 +1,6 @@
 """The Game of Hog."""
 
+from fractions import Fraction
 from dice import four_sided, six_sided, make_test_dice
 from ucb import main, trace, log_current_line, interact
 
@@ -32,6 +33,44 @@ def roll_dice(num_rolls, dice=six_sided):
         return 1
     return total
 
+_roll_counts = {}
+
+def roll_dice_distribution(num_rolls, sides=6):
+    """Return the exact probability distribution of roll_dice(NUM_ROLLS, dice)
+    for fair DICE with SIDES sides, as a dict mapping each turn total to its
+    probability as a Fraction.  The dict is shared, so it must not be changed.
+
+    A turn without a 1 is NUM_ROLLS independent rolls of 2 to SIDES, so the
+    number of ways to reach each total is the repeated convolution of those
+    outcomes; every other sequence of rolls Pigs out and scores 1.
+
+    >>> d = roll_dice_distribution(2, 4)
+    >>> d[1], d[4], d[7], d[8]
+    (Fraction(7, 16), Fraction(1, 16), Fraction(1, 8), Fraction(1, 16))
+    >>> sum(d.values())
+    Fraction(1, 1)
+    >>> roll_dice_distribution(10, 6)[1]
+    Fraction(50700551, 60466176)
+    """
+    key = (num_rolls, sides)
+    if key not in _roll_counts:
+        ways = [1]  # ways[t]: sequences of rolls without a 1 that total t
+        for _ in range(num_rolls):
+            convolved = [0] * (len(ways) + sides)
+            for total, count in enumerate(ways):
+                if count:
+                    for outcome in range(2, sides + 1):
+                        convolved[total + outcome] += count
+            ways = convolved
+        sequences = sides ** num_rolls
+        distribution = {total: Fraction(count, sequences)
+                        for total, count in enumerate(ways) if count}
+        pig_out = sequences - sum(ways)
+        if pig_out:
+            distribution[1] = Fraction(pig_out, sequences)
+        _roll_counts[key] = distribution
+    return _roll_counts[key]
+
 def take_bacon(opponent_score):
     return max(opponent_score % 10, opponent_score // 10) + 1
 
@@ -203,8 +242,15 @@ def average_win_rate(num_iters, strategy, baseline=always_roll(BASELINE_NUM_ROLL
     win_rate_as_player_1 = make_averaged(winner, num_iters)(baseline, strategy)
     return (win_rate_as_player_0 + win_rate_as_player_1) / 2 # Average results
 
-def run_experiments(num_iters):
-    """Run a series of strategy experiments and report results."""
+def run_experiments(num_iters, seed=None, processes=None):
+    """Run a series of strategy experiments and report results.  Games are
+    played across PROCESSES processes, and a SEED makes the results
+    reproducible."""
+    from hog_experiments import parallel_win_rate
+    def win_rate(num_iters, strategy):
+        return parallel_win_rate(num_iters, strategy, seed=seed,
+                                 processes=processes)
+
     if False: # Change to False when done finding max_scoring_num_rolls
         six_sided_max = max_scoring_num_rolls(num_iters, six_sided)
         print('Max scoring num rolls for six-sided dice:', six_sided_max)
@@ -212,16 +258,16 @@ def run_experiments(num_iters):
         print('Max scoring num rolls for four-sided dice:', four_sided_max)
 
     if False: # Change to True to test always_roll(8)
-        print('always_roll(8) win rate:', average_win_rate(num_iters, always_roll(8)))
+        print('always_roll(8) win rate:', win_rate(num_iters, always_roll(8)))
 
     if False: # Change to True to test bacon_strategy
-        print('bacon_strategy win rate:', average_win_rate(num_iters, bacon_strategy))
+        print('bacon_strategy win rate:', win_rate(num_iters, bacon_strategy))
 
     if False: # Change to True to test swap_strategy
-        print('swap_strategy win rate:', average_win_rate(num_iters, swap_strategy))
+        print('swap_strategy win rate:', win_rate(num_iters, swap_strategy))
 
     if True: # Change to True to test final_strategy
-        print('final_strategy win rate:', average_win_rate(num_iters, final_strategy))
+        print('final_strategy win rate:', win_rate(num_iters, final_strategy))
 
     "*** You may add additional experiments as you wish ***"
 
@@ -359,24 +405,33 @@ d_four_sided = None
 d_six_sided = None
 
 def build_distribution_tables():
-    print('building distribution tables...')
+    """Fill d_four_sided and d_six_sided with the exact distributions of 1 to
+    10 rolls of each die, with probabilities as floats."""
     global d_four_sided
     global d_six_sided
     d_four_sided = [None] * 11
     d_six_sided = [None] * 11
     for num_rolls in range(1, 11):
-        print('%d rolls...' % (num_rolls, ))
-        d_four_sided[num_rolls] = d_dist(num_rolls, four_sided)
-        d_six_sided[num_rolls] = d_dist(num_rolls, six_sided)
-    print('done.')
+        for table, sides in ((d_four_sided, 4), (d_six_sided, 6)):
+            exact = roll_dice_distribution(num_rolls, sides)
+            table[num_rolls] = {x: float(p) for x, p in exact.items()}
 
 def get_distribution(num_rolls, dice):
+    """The distribution of roll_dice(NUM_ROLLS, DICE), which is exact for fair
+    dice and sampled for any other dice.
+
+    >>> get_distribution(1, four_sided)
+    {2: 0.25, 3: 0.25, 4: 0.25, 1: 0.25}
+    """
     if d_four_sided is None or d_six_sided is None:
       build_distribution_tables()
     if dice == four_sided:
         return d_four_sided[num_rolls]
     elif dice == six_sided:
         return d_six_sided[num_rolls]
+    elif hasattr(dice, 'sides'):
+        return {x: float(p) for x, p in
+                roll_dice_distribution(num_rolls, dice.sides).items()}
     else:
         return d_dist(num_rolls, dice)
 
@@ -471,6 +526,10 @@ def run(*args):
     parser.add_argument('--num_iters', '-n', type=int,
                         help='Set number of iterations for win rate',
                         default=1000)
+    parser.add_argument('--seed', '-s', type=int,
+                        help='Set the random seed for experiments')
+    parser.add_argument('--processes', '-p', type=int,
+                        help='Set number of processes for experiments')
     args = parser.parse_args()
 
     if args.interactive:
@@ -485,4 +544,4 @@ def run(*args):
             print('\nQuitting interactive test')
             exit(0)
     elif args.run_experiments:
-        run_experiments(args.num_iters)
+        run_experiments(args.num_iters, args.seed, args.processes)
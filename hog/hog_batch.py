@@ -0,0 +1,194 @@
+"""A simulator that plays many games of Hog at once with NumPy.
+
+Usage: python3 hog_batch.py [--num_games N] [--seed SEED]
+
+Games are played in lockstep: every unfinished game takes its next turn
+together, as operations on arrays of scores, so that rolling dice, Pig Out,
+Free Bacon, Hog Wild and Swine Swap each cost a few array operations per turn
+rather than a Python call per die.  The points of each turn are drawn with a
+single random number from the exact distribution of roll_dice, rather than by
+rolling each die.  Strategies are given as policies: arrays of rolls indexed
+by score and opponent score, such as the TableStrategy returned by
+hog_solver.tabulate.
+"""
+
+import numpy as np
+from hog import GOAL_SCORE, roll_dice_distribution, take_bacon
+from ucb import main
+
+BATCH_SIZE = 100000  # Games simulated together, limiting memory use
+MAX_ROLLS = 10
+
+def alias_table(distribution):
+    """Return lists of cutoffs, outcomes, and aliases for sampling from
+    DISTRIBUTION, a dict of outcomes and their probabilities, with Vose's
+    alias method: for u drawn uniformly from [0, N) for N outcomes, the
+    sample is OUTCOMES[j] if u - j < CUTOFFS[j] and ALIASES[j] otherwise,
+    where j = floor(u).
+
+    >>> alias_table({1: 0.5, 2: 0.25, 3: 0.25})
+    ([1.0, 0.75, 0.75], [1, 2, 3], [1, 1, 1])
+    """
+    outcomes = sorted(distribution)
+    n = len(outcomes)
+    scaled = [distribution[x] * n for x in outcomes]
+    cutoffs, aliases = [1.0] * n, list(outcomes)
+    small = [j for j in range(n) if scaled[j] < 1]
+    large = [j for j in range(n) if scaled[j] >= 1]
+    while small and large:
+        j, k = small.pop(), large.pop()
+        cutoffs[j], aliases[j] = float(scaled[j]), outcomes[k]
+        scaled[k] -= 1 - scaled[j]
+        if scaled[k] < 1:
+            small.append(k)
+        else:
+            large.append(k)
+    return cutoffs, outcomes, aliases
+
+def outcome_tables():
+    """Return arrays that sample the points of every kind of turn.  Turns
+    rolling N dice with four-sided dice if WILD is 1 and six-sided dice
+    otherwise have the alias table of roll_dice_distribution at OFFSETS[g] of
+    CUTOFFS, POINTS and ALIASES, with SIZES[g] entries, where g = 11*WILD + N.
+
+    A Pig Out is the outcome 1 of those distributions, so a turn costs one
+    random number instead of one per die.  Free Bacon (N = 0) is chosen
+    separately, and has a single entry of 0 points.
+    """
+    offsets, sizes, cutoffs, points, aliases = [], [], [], [], []
+    for sides in (6, 4):
+        for num_rolls in range(MAX_ROLLS + 1):
+            if num_rolls == 0:
+                table = [1.0], [0], [0]
+            else:
+                table = alias_table(roll_dice_distribution(num_rolls, sides))
+            offsets.append(len(points))
+            sizes.append(len(table[1]))
+            cutoffs.extend(table[0])
+            points.extend(table[1])
+            aliases.extend(table[2])
+    return tuple(np.array(a) for a in (offsets, sizes, cutoffs, points, aliases))
+
+_offsets, _sizes, _cutoffs, _points, _aliases = outcome_tables()
+_rule_tables = {}
+
+def rule_tables(goal):
+    """Return arrays HOG_WILD, whether four-sided dice are rolled for each sum
+    of two scores below GOAL, and BACON, the points of Free Bacon for each
+    opponent score below GOAL.  These are computed once for each GOAL.
+
+    >>> hog_wild, bacon = rule_tables(10)
+    >>> hog_wild.nonzero(), bacon[:4]
+    ((array([ 0,  7, 14]),), array([1, 2, 3, 4]))
+    """
+    if goal not in _rule_tables:
+        _rule_tables[goal] = (
+            np.array([total % 7 == 0 for total in range(2 * goal)]),
+            np.array([take_bacon(score) for score in range(goal)]))
+    return _rule_tables[goal]
+
+def take_turns(policy, score, opponent_score, rng, goal=GOAL_SCORE):
+    """Return the points scored by the player about to roll in each game,
+    choosing the number of rolls from the array POLICY, for scores below
+    GOAL.
+
+    >>> rng = np.random.default_rng(0)
+    >>> policy = np.zeros((100, 100), dtype=np.int8)
+    >>> take_turns(policy, np.array([0, 10]), np.array([39, 0]), rng)
+    array([10,  1])
+    """
+    hog_wild, bacon = rule_tables(goal)
+    num_rolls = policy[score, opponent_score]
+    g = (MAX_ROLLS + 1) * hog_wild[score + opponent_score] + num_rolls
+    u = rng.random(len(score)) * _sizes[g]
+    j = u.astype(np.int64)
+    i = _offsets[g] + j
+    rolled = np.where(u - j < _cutoffs[i], _points[i], _aliases[i])
+    return np.where(num_rolls == 0, bacon[opponent_score], rolled)
+
+def play_batch(policy0, policy1, num_games, rng, goal=GOAL_SCORE):
+    """Simulate NUM_GAMES games of play between POLICY0 and POLICY1 and return
+    arrays of the final scores of Player 0 and of Player 1.
+
+    >>> import hog
+    >>> bacon = hog.always_roll(0)
+    >>> hog.play(bacon, bacon)
+    (91, 103)
+    >>> rng = np.random.default_rng(0)
+    >>> policy = np.zeros((100, 100), dtype=np.int8)
+    >>> score0, score1 = play_batch(policy, policy, 3, rng)
+    >>> score0, score1
+    (array([91, 91, 91]), array([103, 103, 103]))
+
+    POLICY0 and POLICY1 must choose rolls for every score below GOAL.
+
+    >>> policy = np.full((150, 150), 5, dtype=np.int8)
+    >>> score0, score1 = play_batch(policy, policy, 1000, rng, goal=150)
+    >>> bool((np.maximum(score0, score1) >= 150).all())
+    True
+    """
+    policies = (np.asarray(policy0), np.asarray(policy1))
+    final = np.zeros((2, num_games), dtype=np.int64)
+    live = np.arange(num_games)  # Games that are not over
+    scores = [np.zeros(num_games, dtype=np.int64)] * 2  # Those games' scores
+    who = 0  # Every game has the same player about to roll
+    while len(live):
+        score, opponent_score = scores[who], scores[1 - who]
+        score = score + take_turns(policies[who], score, opponent_score, rng,
+                                   goal)
+        swap = (score == 2 * opponent_score) | (opponent_score == 2 * score)
+        scores[who] = np.where(swap, opponent_score, score)
+        scores[1 - who] = np.where(swap, score, opponent_score)
+        over = np.maximum(score, opponent_score) >= goal
+        if over.any():
+            final[:, live[over]] = scores[0][over], scores[1][over]
+            going = ~over
+            live, scores = live[going], [s[going] for s in scores]
+        who = 1 - who
+    return final[0], final[1]
+
+def count_wins(policy0, policy1, num_games, rng, goal=GOAL_SCORE):
+    """The number of NUM_GAMES games that POLICY0 wins against POLICY1 when
+    POLICY0 goes first, simulated BATCH_SIZE games at a time."""
+    wins = 0
+    for start in range(0, num_games, BATCH_SIZE):
+        size = min(BATCH_SIZE, num_games - start)
+        score0, score1 = play_batch(policy0, policy1, size, rng, goal)
+        wins += int((score0 > score1).sum())
+    return wins
+
+def batch_win_rate(policy, baseline, num_games, seed=None, goal=GOAL_SCORE):
+    """The average win rate of POLICY against BASELINE over NUM_GAMES games in
+    each order of play, as average_win_rate estimates it.
+
+    >>> from hog_solver import tabulate
+    >>> import hog
+    >>> policy = tabulate(hog.always_roll(5))
+    >>> abs(batch_win_rate(policy, policy, 100000, seed=0) - 0.5) < 0.005
+    True
+    """
+    rng = np.random.default_rng(seed)
+    first = count_wins(policy, baseline, num_games, rng, goal)
+    second = num_games - count_wins(baseline, policy, num_games, rng, goal)
+    return (first + second) / (2 * num_games)
+
+@main
+def run(*args):
+    import argparse
+    import time
+    import hog
+    from hog_solver import optimal_strategy, tabulate, win_rate
+    parser = argparse.ArgumentParser(description="Simulate games of Hog")
+    parser.add_argument('--num_games', '-n', type=int, default=1000000,
+                        help='Games to play in each order')
+    parser.add_argument('--seed', '-s', type=int, help='Random seed')
+    args = parser.parse_args(args)
+
+    baseline = hog.always_roll(hog.BASELINE_NUM_ROLLS)
+    policy, baseline_policy = tabulate(optimal_strategy), tabulate(baseline)
+    start = time.perf_counter()
+    rate = batch_win_rate(policy, baseline_policy, args.num_games, args.seed)
+    elapsed = time.perf_counter() - start
+    print('Played {0} games in {1:.2f}s'.format(2 * args.num_games, elapsed))
+    print('optimal win rate: {0:.6f} (exact {1:.6f})'.format(
+        rate, win_rate(optimal_strategy, baseline)))
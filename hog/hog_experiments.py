@@ -0,0 +1,318 @@
+"""Strategy experiments that play many games across a pool of processes.
+
+Usage: python3 hog_experiments.py [--num_iters N] [--width W] [--seed SEED]
+                                  [--processes P]
+
+Games are played in shards of SHARD_SIZE games.  Each shard seeds the dice
+(and the random module, for strategies that use it) with its own seed,
+derived from a master seed, so that an experiment with the same master seed
+gives the same result no matter how many processes play its shards or in
+what order they finish.
+
+Adaptive experiments play shards until an Agresti-Coull confidence interval
+for the result is narrower than a requested width.  When comparing two strategies, both play
+their games against the baseline with the same seeds (common random numbers),
+so that luck with the dice largely cancels from the difference.
+"""
+
+import math
+import random
+from collections import namedtuple
+import dice
+from hog import BASELINE_NUM_ROLLS, always_roll, winner
+from hog_solver import tabulate
+from ucb import main
+
+SHARD_SIZE = 500  # Games played by a process for each task
+MIN_ITERS = 2000  # Pairs of games played before an interval is first checked
+
+def prepare(strategy):
+    """Return a TableStrategy of STRATEGY, which is fast to call and can be
+    sent to another process, or STRATEGY itself if it cannot be tabulated
+    because its choices are not determined by the scores alone.
+
+    >>> from hog import final_strategy
+    >>> prepare(final_strategy) == tabulate(final_strategy)
+    True
+    >>> import random
+    >>> def random_strategy(score, opponent_score):
+    ...     return random.randrange(11)
+    >>> prepare(random_strategy) is random_strategy
+    True
+    """
+    try:
+        return tabulate(strategy)
+    except ValueError:
+        return strategy
+
+def shard_seeds(seed, num_games):
+    """Return a list of (games, seed) pairs, one for each shard of NUM_GAMES
+    games, with seeds derived from the master SEED.
+
+    >>> [games for games, _ in shard_seeds(1, 1200)]
+    [500, 500, 200]
+    >>> shard_seeds(1, 1200) == shard_seeds(1, 1200)
+    True
+    """
+    master = random.Random(seed)
+    return [(min(SHARD_SIZE, num_games - start), master.getrandbits(64))
+            for start in range(0, num_games, SHARD_SIZE)]
+
+def seed_games(seed):
+    """Seed the dice and the random module with SEED."""
+    random.seed(seed)
+    dice.seed(seed)
+
+def count_wins(strategy0, strategy1, num_games, seed):
+    """The number of NUM_GAMES games that STRATEGY0 wins against STRATEGY1
+    when STRATEGY0 goes first, with games seeded by SEED.  The state of the
+    random module is restored afterwards, and the dice are seeded afresh.
+
+    >>> count_wins(always_roll(0), always_roll(0), 3, 1) # Bacon always loses
+    0
+    """
+    state = random.getstate()
+    seed_games(seed)
+    try:
+        return sum(winner(strategy0, strategy1) == 0 for _ in range(num_games))
+    finally:
+        random.setstate(state)
+        dice.seed()
+
+def _count_shard(task):
+    return count_wins(*task)
+
+def count_wins_parallel(strategy0, strategy1, num_games, seed=None,
+                        processes=None):
+    """The number of NUM_GAMES games that STRATEGY0 wins against STRATEGY1
+    when STRATEGY0 goes first, played in shards across PROCESSES processes
+    (by default, one for each CPU).  Games are played in this process if
+    PROCESSES is 1.
+    """
+    if processes is None:
+        import os
+        processes = os.cpu_count() or 1
+    strategy0, strategy1 = prepare(strategy0), prepare(strategy1)
+    shards = shard_seeds(seed, num_games)
+    if processes == 1 or len(shards) == 1:
+        return sum(count_wins(strategy0, strategy1, games, shard_seed)
+                   for games, shard_seed in shards)
+    from concurrent.futures import ProcessPoolExecutor
+    tasks = [(strategy0, strategy1, games, shard_seed)
+             for games, shard_seed in shards]
+    with ProcessPoolExecutor(processes) as pool:
+        return sum(pool.map(_count_shard, tasks))
+
+def parallel_win_rate(num_iters, strategy,
+                      baseline=always_roll(BASELINE_NUM_ROLLS), seed=None,
+                      processes=None):
+    """Return the average win rate (0 to 1) of STRATEGY against BASELINE over
+    NUM_ITERS games in each order of play, as average_win_rate does, but with
+    games played across PROCESSES processes.  The result depends only on
+    SEED, if one is given.
+
+    >>> rate = parallel_win_rate(1000, always_roll(5), seed=61, processes=1)
+    >>> rate == parallel_win_rate(1000, always_roll(5), seed=61, processes=2)
+    True
+    """
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+    seeds = random.Random(seed)
+    first = count_wins_parallel(strategy, baseline, num_iters,
+                                seeds.getrandbits(64), processes)
+    second = num_iters - count_wins_parallel(baseline, strategy, num_iters,
+                                             seeds.getrandbits(64), processes)
+    return (first + second) / (2 * num_iters)
+
+Estimate = namedtuple('Estimate', ['mean', 'low', 'high', 'games'])
+
+def play_pair(strategy, baseline, seed):
+    """The win rate (0, 0.5 or 1) of STRATEGY against BASELINE over one game
+    as each player, each played with games seeded by SEED.
+
+    >>> play_pair(always_roll(0), always_roll(0), 1) # Bacon loses first
+    0.5
+    """
+    seed_games(seed)
+    first = winner(strategy, baseline) == 0
+    seed_games(seed)
+    second = winner(baseline, strategy) == 1
+    return (first + second) / 2
+
+def _sample_shard(task):
+    """Return the number, sum and sum of squares of a shard's samples: the
+    win rates of the first strategy of a task, less those of the second
+    strategy, if there is one, for games played with the same seeds (or with
+    other seeds, if not PAIRED)."""
+    strategies, baseline, games, shard_seed, paired = task
+    seeds = random.Random(shard_seed)
+    total = total_squares = 0
+    state = random.getstate()
+    try:
+        for _ in range(games):
+            game_seed = seeds.getrandbits(64)
+            x = play_pair(strategies[0], baseline, game_seed)
+            if len(strategies) == 2:
+                if not paired:
+                    game_seed = seeds.getrandbits(64)
+                x -= play_pair(strategies[1], baseline, game_seed)
+            total += x
+            total_squares += x * x
+    finally:
+        random.setstate(state)
+        dice.seed()
+    return games, total, total_squares
+
+def agresti_coull(n, total, total_squares, z, low, high):
+    """Return the bounds of an interval for the mean of N samples between LOW
+    and HIGH with TOTAL and TOTAL_SQUARES, at the normal quantile Z, after
+    adding z*z/2 pseudo-samples at each of LOW and HIGH.  For samples of 0 or
+    1, this is the Agresti-Coull interval for a proportion, which, unlike the
+    plain normal interval, is not empty when every sample is the same.  The
+    bounds are clipped to LOW and HIGH.
+
+    >>> [round(x, 4) for x in agresti_coull(100, 100, 100, 1.96, 0, 1)]
+    [0.9556, 1]
+    """
+    k = z * z / 2
+    m = n + 2 * k
+    mean = (total + k * (low + high)) / m
+    variance = max((total_squares + k * (low * low + high * high)) / m
+                   - mean * mean, 0)
+    half_width = z * math.sqrt(variance / m)
+    return max(mean - half_width, low), min(mean + half_width, high)
+
+def sequential_estimate(strategies, baseline, width, confidence=0.95,
+                        seed=None, processes=None, max_iters=10**6,
+                        paired=True, min_iters=MIN_ITERS):
+    """Return an Estimate of the win rate against BASELINE of the first of
+    STRATEGIES, less that of the second if there are two, with an
+    Agresti-Coull CONFIDENCE interval from LOW to HIGH after playing GAMES
+    pairs of games.
+
+    Shards are played until at least MIN_ITERS pairs have been played and the
+    interval is at most WIDTH wide, or MAX_ITERS pairs have been played.  The
+    interval is checked after each shard in order, so that the result depends
+    only on SEED, not on PROCESSES.  No allowance is made for checking it
+    repeatedly, so the chance that the final interval covers the true rate is
+    somewhat less than CONFIDENCE.
+    """
+    if processes is None:
+        import os
+        processes = os.cpu_count() or 1
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+    from statistics import NormalDist
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    lowest = -1 if len(strategies) == 2 else 0  # The lowest sample
+    master = random.Random(seed)
+    strategies = tuple(prepare(s) for s in strategies)
+    baseline = prepare(baseline)
+    pool = None
+    if processes > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(processes)
+    n = total = total_squares = 0
+    try:
+        while True:
+            tasks, planned = [], n
+            for _ in range(processes):
+                games = min(SHARD_SIZE, max_iters - planned)
+                if games > 0:
+                    tasks.append((strategies, baseline, games,
+                                  master.getrandbits(64), paired))
+                    planned += games
+            if pool:
+                results = pool.map(_sample_shard, tasks)
+            else:
+                results = map(_sample_shard, tasks)
+            for games, shard_total, shard_squares in results:
+                n += games
+                total += shard_total
+                total_squares += shard_squares
+                if n < min_iters and n < max_iters:
+                    continue
+                low, high = agresti_coull(n, total, total_squares, z,
+                                          lowest, 1)
+                if high - low <= width or n >= max_iters:
+                    return Estimate(total / n, low, high, n)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+def adaptive_win_rate(strategy, baseline=always_roll(BASELINE_NUM_ROLLS),
+                      width=0.02, confidence=0.95, seed=None, processes=None,
+                      max_iters=10**6):
+    """Return an Estimate of the average win rate of STRATEGY against
+    BASELINE, playing games until its CONFIDENCE interval is at most WIDTH
+    wide.
+
+    >>> bacon = always_roll(0) # Wins exactly half of its games against itself
+    >>> estimate = adaptive_win_rate(bacon, bacon, seed=1, processes=1)
+    >>> estimate.mean, round(estimate.low, 4), round(estimate.high, 4)
+    (0.5, 0.499, 0.501)
+    >>> estimate.games
+    2000
+    """
+    return sequential_estimate((strategy,), baseline, width, confidence,
+                               seed, processes, max_iters)
+
+def compare_strategies(strategy0, strategy1,
+                       baseline=always_roll(BASELINE_NUM_ROLLS), width=0.02,
+                       confidence=0.95, seed=None, processes=None,
+                       max_iters=10**6, paired=True):
+    """Return an Estimate of how much higher the average win rate of
+    STRATEGY0 against BASELINE is than that of STRATEGY1.  If PAIRED, both
+    strategies play with the same dice, which usually needs far fewer games
+    for the same WIDTH of interval.
+
+    >>> estimate = compare_strategies(always_roll(5), always_roll(5), seed=1,
+    ...                               processes=1)
+    >>> estimate.mean, round(estimate.low, 4), round(estimate.high, 4)
+    (0.0, -0.0019, 0.0019)
+    """
+    return sequential_estimate((strategy0, strategy1), baseline, width,
+                               confidence, seed, processes, max_iters, paired)
+
+@main
+def run(*args):
+    import argparse
+    import time
+    import hog
+    parser = argparse.ArgumentParser(description="Run Hog experiments")
+    parser.add_argument('--num_iters', '-n', type=int, default=10000,
+                        help='Games to play in each order')
+    parser.add_argument('--width', '-w', type=float,
+                        help='Play until the 95%% confidence interval is '
+                             'this wide, rather than a fixed number of games')
+    parser.add_argument('--seed', '-s', type=int, help='Master random seed')
+    parser.add_argument('--processes', '-p', type=int,
+                        help='Number of processes (default: one per CPU)')
+    args = parser.parse_args(args)
+
+    if args.width:
+        for name in ('bacon_strategy', 'swap_strategy', 'final_strategy'):
+            start = time.perf_counter()
+            estimate = adaptive_win_rate(getattr(hog, name), width=args.width,
+                                         seed=args.seed,
+                                         processes=args.processes)
+            print('{0} win rate: {1:.4f} [{2:.4f}, {3:.4f}] after {4} games'
+                  ' ({5:.2f}s)'.format(name, *estimate,
+                                      time.perf_counter() - start))
+        for paired in (True, False):
+            start = time.perf_counter()
+            estimate = compare_strategies(
+                hog.swap_strategy, hog.bacon_strategy, width=args.width,
+                seed=args.seed, processes=args.processes, paired=paired)
+            print('swap - bacon ({0}): {1:.4f} [{2:.4f}, {3:.4f}] after {4}'
+                  ' games ({5:.2f}s)'.format(
+                      'paired' if paired else 'independent', *estimate,
+                      time.perf_counter() - start))
+        return
+
+    for name in ('bacon_strategy', 'swap_strategy', 'final_strategy'):
+        start = time.perf_counter()
+        rate = parallel_win_rate(args.num_iters, getattr(hog, name),
+                                 seed=args.seed, processes=args.processes)
+        print('{0} win rate: {1:.4f} ({2:.2f}s)'.format(
+            name, rate, time.perf_counter() - start))
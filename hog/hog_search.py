@@ -0,0 +1,205 @@
+"""A search for the best parameters of families of strategies for Hog.
+
+Usage: python3 hog_search.py [--family NAME] [--method grid|climb]
+                             [--processes P]
+
+Each family makes a strategy from parameters that hog.py fixes as constants:
+BACON_MARGIN and BASELINE_NUM_ROLLS for bacon_strategy and swap_strategy, and
+FOUR_SIDED_VALUE for compute_heuristic_score.  Candidates are tabulated and
+scored by their exact win rate against a baseline (hog_solver.win_rate),
+each distinct table once, across a pool of processes.  A grid search scores
+every candidate; hill climbing moves from the current constants to the best
+neighboring parameters until none is better.
+"""
+
+import os
+from hog import GOAL_SCORE, BACON_MARGIN, BASELINE_NUM_ROLLS, FOUR_SIDED_VALUE
+from hog import always_roll, take_bacon, select_dice, get_distribution
+from hog import compute_expected_score, compute_four_sided_p
+from hog_solver import MAX_ROLLS, TableStrategy, tabulate
+from hog_solver import win_rate
+from ucb import main
+
+def bacon_family(margin=BACON_MARGIN, num_rolls=BASELINE_NUM_ROLLS):
+    """Return bacon_strategy with MARGIN for BACON_MARGIN and NUM_ROLLS for
+    BASELINE_NUM_ROLLS.
+
+    >>> from hog import bacon_strategy
+    >>> tabulate(bacon_family()) == tabulate(bacon_strategy)
+    True
+    """
+    def strategy(score, opponent_score):
+        if take_bacon(opponent_score) >= margin:
+            return 0
+        return num_rolls
+    return strategy
+
+def swap_family(margin=BACON_MARGIN, num_rolls=BASELINE_NUM_ROLLS):
+    """Return swap_strategy with MARGIN for BACON_MARGIN and NUM_ROLLS for
+    BASELINE_NUM_ROLLS.
+
+    >>> from hog import swap_strategy
+    >>> tabulate(swap_family()) == tabulate(swap_strategy)
+    True
+    """
+    def strategy(score, opponent_score):
+        bacon = take_bacon(opponent_score)
+        if opponent_score == 2 * (score + bacon):
+            return 0
+        elif score + bacon == 2 * opponent_score:
+            return num_rolls
+        if bacon >= margin:
+            return 0
+        return num_rolls
+    return strategy
+
+_heuristic_terms = None
+
+def heuristic_terms():
+    """A list of lists, one for each state in the order of a TableStrategy,
+    of the expected score and the chance of leaving the opponent four-sided
+    dice, as computed by compute_heuristic_score, for 0 to MAX_ROLLS rolls.
+    These are computed once, since every FOUR_SIDED_VALUE weighs the same
+    terms."""
+    global _heuristic_terms
+    if _heuristic_terms is None:
+        _heuristic_terms = []
+        for score in range(GOAL_SCORE):
+            for opponent_score in range(GOAL_SCORE):
+                dice = select_dice(score, opponent_score)
+                distributions = [{take_bacon(opponent_score): 1}] + [
+                    get_distribution(num_rolls, dice)
+                    for num_rolls in range(1, MAX_ROLLS + 1)]
+                _heuristic_terms.append([
+                    (compute_expected_score(score, opponent_score, d),
+                     compute_four_sided_p(score, opponent_score, d))
+                    for d in distributions])
+    return _heuristic_terms
+
+def heuristic_family(four_sided_value=FOUR_SIDED_VALUE):
+    """Return a TableStrategy that rolls the number of dice with the highest
+    compute_heuristic_score, with FOUR_SIDED_VALUE for FOUR_SIDED_VALUE, and
+    the fewest dice among equal scores.  With a FOUR_SIDED_VALUE of 0, this
+    is final_strategy.
+
+    >>> from hog import final_strategy
+    >>> heuristic_family(0) == tabulate(final_strategy)
+    True
+    """
+    choices = []
+    for terms in heuristic_terms():
+        best_rolls, best = 0, None
+        for num_rolls, (expected, four_sided_p) in enumerate(terms):
+            value = expected + four_sided_p * four_sided_value
+            if best is None or value > best:
+                best_rolls, best = num_rolls, value
+        choices.append(best_rolls)
+    return TableStrategy([choices[k:k + GOAL_SCORE]
+                          for k in range(0, len(choices), GOAL_SCORE)])
+
+# Each family is a function of keyword parameters and the values to search
+FAMILIES = {
+    'bacon': (bacon_family, {'margin': list(range(1, 13)),
+                             'num_rolls': list(range(1, MAX_ROLLS + 1))}),
+    'swap': (swap_family, {'margin': list(range(1, 13)),
+                           'num_rolls': list(range(1, MAX_ROLLS + 1))}),
+    'heuristic': (heuristic_family, {'four_sided_value':
+                                     [k / 2 for k in range(21)]}),
+}
+
+def _win_rate(task):
+    table, baseline = task
+    return win_rate(table, baseline)
+
+def score_candidates(family, candidates, baseline, processes=None):
+    """Return a list of the exact win rates against BASELINE of the strategies
+    made by the FAMILY function from each dict of parameters in CANDIDATES.
+    Candidates with the same choices are scored once, across PROCESSES
+    processes."""
+    tables = [tabulate(family(**params)) for params in candidates]
+    distinct = list({table.digest: table for table in tables}.values())
+    baseline = tabulate(baseline)
+    tasks = [(table, baseline) for table in distinct]
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or len(tasks) < 2:
+        rates = list(map(_win_rate, tasks))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(processes) as pool:
+            rates = list(pool.map(_win_rate, tasks))
+    by_digest = {table.digest: rate for table, rate in zip(distinct, rates)}
+    return [by_digest[table.digest] for table in tables]
+
+def grid_search(family, grid, baseline=always_roll(BASELINE_NUM_ROLLS),
+                processes=None):
+    """Return a list of (win rate, parameters) pairs for every combination of
+    the values in GRID, a dict of parameter names and lists of values, from
+    best to worst.
+
+    >>> grid = {'margin': [8, 10], 'num_rolls': [4, 5]}
+    >>> rate, params = grid_search(bacon_family, grid, processes=1)[0]
+    >>> round(rate, 4), params
+    (0.5558, {'margin': 8, 'num_rolls': 5})
+    """
+    candidates = [{}]
+    for name, values in grid.items():
+        candidates = [dict(params, **{name: value})
+                      for params in candidates for value in values]
+    rates = score_candidates(family, candidates, baseline, processes)
+    results = list(zip(rates, candidates))
+    return sorted(results, key=lambda result: -result[0])
+
+def hill_climb(family, grid, start, baseline=always_roll(BASELINE_NUM_ROLLS),
+               processes=None):
+    """Return the (win rate, parameters) pair found by moving from the
+    parameters START, one step through the values of GRID at a time, to the
+    best of the neighboring parameters until none is better.
+    """
+    position = {name: values.index(start[name])
+                for name, values in grid.items()}
+    def params_at(position):
+        return {name: grid[name][k] for name, k in position.items()}
+    best = score_candidates(family, [params_at(position)], baseline,
+                            processes)[0]
+    while True:
+        neighbors = []
+        for name, k in position.items():
+            for step in (-1, 1):
+                if 0 <= k + step < len(grid[name]):
+                    neighbors.append(dict(position, **{name: k + step}))
+        rates = score_candidates(family, [params_at(p) for p in neighbors],
+                                 baseline, processes)
+        rate, neighbor = max(zip(rates, neighbors), key=lambda r: r[0])
+        if rate <= best:
+            return best, params_at(position)
+        best, position = rate, neighbor
+
+@main
+def run(*args):
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Tune Hog strategies")
+    parser.add_argument('--family', '-f', choices=sorted(FAMILIES),
+                        default='bacon', help='Family of strategies to tune')
+    parser.add_argument('--method', '-m', choices=['grid', 'climb'],
+                        default='grid', help='Search every candidate, or '
+                        'climb from the constants in hog.py')
+    parser.add_argument('--processes', '-p', type=int,
+                        help='Number of processes (default: one per CPU)')
+    args = parser.parse_args(args)
+
+    family, grid = FAMILIES[args.family]
+    start = time.perf_counter()
+    if args.method == 'grid':
+        results = grid_search(family, grid, processes=args.processes)
+    else:
+        constants = {'margin': BACON_MARGIN, 'num_rolls': BASELINE_NUM_ROLLS,
+                     'four_sided_value': FOUR_SIDED_VALUE}
+        start_params = {name: constants[name] for name in grid}
+        results = [hill_climb(family, grid, start_params,
+                              processes=args.processes)]
+    print('Searched in {0:.2f}s'.format(time.perf_counter() - start))
+    for rate, params in results[:10]:
+        print('{0:.6f}  {1}'.format(rate, ', '.join(
+            '{0}={1}'.format(name, value) for name, value in params.items())))
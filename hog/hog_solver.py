@@ -0,0 +1,337 @@
+"""An optimal strategy for Hog, computed by retrograde analysis.
+
+Usage: python3 hog_solver.py [--goal GOAL] [--output FILE]
+
+Every turn adds at least one point to the sum of the two scores, and a Swine
+Swap only exchanges them, so the chance that the player about to roll wins
+depends only on states whose scores have a larger sum.  The solver visits the
+states in order of decreasing sum, choosing in each the number of rolls that
+maximizes that chance under exactly the rules of play: Free Bacon, Hog Wild,
+Pig Out and Swine Swap.
+
+The same pass with the number of rolls given by a pair of strategies instead
+computes exactly the chance that one strategy beats the other.
+"""
+
+import hashlib
+import random
+import weakref
+from hog import GOAL_SCORE, BASELINE_NUM_ROLLS, always_roll
+from hog import roll_dice_distribution, take_bacon
+from ucb import main
+
+MAX_ROLLS = 10
+ROLL_DIGITS = '0123456789a'  # How each number of rolls is written in a file
+
+def turn_distributions(sides):
+    """A list whose element N lists the (points, probability) pairs of a turn
+    rolling N dice with SIDES sides.  Element 0 is empty: Free Bacon depends
+    on the opponent's score instead.
+
+    >>> turn_distributions(4)[1]
+    [(2, 0.25), (3, 0.25), (4, 0.25), (1, 0.25)]
+    """
+    return [[]] + [[(x, float(p)) for x, p in
+                    roll_dice_distribution(num_rolls, sides).items()]
+                   for num_rolls in range(1, MAX_ROLLS + 1)]
+
+def states_by_sum(goal=GOAL_SCORE):
+    """Yield every (score, opponent_score) with both scores below GOAL, in
+    order of decreasing sum.
+
+    >>> list(states_by_sum(2))
+    [(1, 1), (0, 1), (1, 0), (0, 0)]
+    """
+    for total in range(2 * goal - 2, -1, -1):
+        for score in range(max(0, total - goal + 1), min(total, goal - 1) + 1):
+            yield score, total - score
+
+def turn_value(score, opponent_score, x, win, goal=GOAL_SCORE):
+    """The chance that the current player wins the game after scoring X points
+    this turn from SCORE to OPPONENT_SCORE, where WIN[s][o] is the chance that
+    the opponent, moving next with score s against score o, wins.
+
+    >>> turn_value(90, 40, 10, None) # Reaches the goal
+    1.0
+    >>> turn_value(90, 50, 10, None) # Swine Swap gives the opponent 100
+    0.0
+    """
+    new_score = score + x
+    if new_score == 2 * opponent_score or opponent_score == 2 * new_score:
+        # Swine Swap: the opponent takes NEW_SCORE and we take theirs
+        if new_score >= goal:
+            return 0.0
+        return 1 - win[new_score][opponent_score]
+    elif new_score >= goal:
+        return 1.0
+    return 1 - win[opponent_score][new_score]
+
+def turn_values(score, opponent_score, win, goal=GOAL_SCORE):
+    """A list whose element X is turn_value(SCORE, OPPONENT_SCORE, X, WIN) for
+    every number of points that a turn can score.  Element 0 is unused."""
+    return [None] + [turn_value(score, opponent_score, x, win, goal)
+                     for x in range(1, 6 * MAX_ROLLS + 1)]
+
+class TableStrategy:
+    """A strategy that rolls POLICY[score][opponent_score] dice, stored as one
+    byte per state, so that choosing a number of rolls is a single index.
+    Unlike a strategy defined by a nested function, it can be pickled, and so
+    passed to another process.  Tables with the same choices are equal and
+    have the same digest.
+
+    >>> strategy = TableStrategy([[3, 4], [5, 6]])
+    >>> strategy(1, 0)
+    5
+    >>> list(strategy[1])
+    [5, 6]
+    >>> strategy == TableStrategy([[3, 4], [5, 6]])
+    True
+    >>> strategy.digest[:16]
+    '0488cd1104793edb'
+    """
+    def __init__(self, policy):
+        self.goal = len(policy)
+        self.rolls = bytes(num_rolls for row in policy for num_rolls in row)
+        assert len(self.rolls) == self.goal ** 2, 'A policy must be square.'
+        self.digest = hashlib.sha256(self.rolls).hexdigest()
+
+    def __call__(self, score, opponent_score):
+        return self.rolls[score * self.goal + opponent_score]
+
+    def __len__(self):
+        return self.goal
+
+    def __getitem__(self, score):
+        """The choices for SCORE against each opponent score."""
+        if not 0 <= score < self.goal:
+            raise IndexError('score out of range')
+        return self.rolls[score * self.goal:(score + 1) * self.goal]
+
+    def __eq__(self, other):
+        return isinstance(other, TableStrategy) and self.rolls == other.rolls
+
+    def __hash__(self):
+        return hash(self.rolls)
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+        array = np.frombuffer(self.rolls, dtype=np.uint8)
+        return array.reshape(self.goal, self.goal).astype(dtype or np.uint8)
+
+    def __repr__(self):
+        return 'TableStrategy(<{0}>)'.format(self.digest[:16])
+
+_tables = weakref.WeakKeyDictionary()  # strategy -> {goal: TableStrategy}
+
+def tabulate(strategy, goal=GOAL_SCORE):
+    """Return a TableStrategy of the number of rolls chosen by STRATEGY in
+    each state with scores below GOAL.  The table is remembered for as long
+    as STRATEGY exists, so tabulating the same strategy again is free.
+
+    STRATEGY is called twice in each state, the second time in the reverse
+    order, and a ValueError is raised if it chooses differently: a strategy
+    that depends on anything but the scores cannot be tabulated.  The state
+    of the random module is restored afterward, so these calls do not change
+    the numbers that the caller draws next.
+
+    >>> table = tabulate(lambda score, opponent_score: score % 2, 3)
+    >>> [list(row) for row in table]
+    [[0, 0, 0], [1, 1, 1], [0, 0, 0]]
+    >>> calls = []
+    >>> def impure(score, opponent_score):
+    ...     calls.append(score)
+    ...     return len(calls) % 2
+    >>> tabulate(impure, 3)
+    Traceback (most recent call last):
+        ...
+    ValueError: strategy chose 1 and then 0 rolls with scores 2 and 2
+    >>> state = random.getstate()
+    >>> table = tabulate(lambda score, opponent_score: random.randrange(1), 3)
+    >>> random.getstate() == state
+    True
+    """
+    if isinstance(strategy, TableStrategy) and strategy.goal == goal:
+        return strategy
+    try:
+        tables = _tables.setdefault(strategy, {})
+    except TypeError:  # Strategies that cannot be weakly referenced
+        tables = {}
+    if goal not in tables:
+        state = random.getstate()
+        try:
+            tables[goal] = _tabulate(strategy, goal)
+        finally:
+            random.setstate(state)
+    return tables[goal]
+
+def _tabulate(strategy, goal):
+    """Call STRATEGY twice in each state, checking that it is pure, and
+    return its TableStrategy."""
+    states = [(score, opponent_score) for score in range(goal)
+              for opponent_score in range(goal)]
+    choices = [strategy(score, opponent_score)
+               for score, opponent_score in states]
+    for num_rolls in choices:
+        assert type(num_rolls) == int, 'num_rolls must be an integer.'
+        assert 0 <= num_rolls <= MAX_ROLLS, 'Cannot roll that many dice.'
+    for (score, opponent_score), num_rolls in zip(reversed(states),
+                                                  reversed(choices)):
+        again = strategy(score, opponent_score)
+        if again != num_rolls:
+            raise ValueError('strategy chose {0} and then {1} rolls with '
+                             'scores {2} and {3}'.format(
+                                 num_rolls, again, score, opponent_score))
+    return TableStrategy([choices[k:k + goal]
+                          for k in range(0, goal * goal, goal)])
+
+def solve(goal=GOAL_SCORE):
+    """Return a pair of GOAL by GOAL tables, POLICY and WIN, where POLICY is a
+    TableStrategy that rolls the number of dice that maximizes the chance of
+    winning, and WIN[score][opponent_score] is that chance.  Among equally
+    good numbers of rolls, the smallest is chosen.
+
+    >>> policy, win = solve(10)
+    >>> policy[9][9], policy[0][5]
+    (0, 4)
+    >>> round(win[0][0], 4), round(win[9][9], 4)
+    (0.5359, 1.0)
+    """
+    four_sided, six_sided = turn_distributions(4), turn_distributions(6)
+    policy = [[0] * goal for _ in range(goal)]
+    win = [[0.0] * goal for _ in range(goal)]
+    for score, opponent_score in states_by_sum(goal):
+        values = turn_values(score, opponent_score, win, goal)
+        if (score + opponent_score) % 7 == 0:
+            distributions = four_sided
+        else:
+            distributions = six_sided
+        best_rolls, best = 0, values[take_bacon(opponent_score)]
+        for num_rolls in range(1, MAX_ROLLS + 1):
+            chance = sum(p * values[x] for x, p in distributions[num_rolls])
+            if chance > best:
+                best_rolls, best = num_rolls, chance
+        policy[score][opponent_score] = best_rolls
+        win[score][opponent_score] = best
+    return TableStrategy(policy), win
+
+def evaluate(strategy0, strategy1, goal=GOAL_SCORE):
+    """Return a pair of GOAL by GOAL tables, WIN0 and WIN1, where WIN0[s][o]
+    is the chance that a player following STRATEGY0 wins when about to roll
+    with score s against a player following STRATEGY1 with score o, and WIN1
+    is the same chance for the player following STRATEGY1.  Both strategies
+    are tabulated first.
+
+    >>> win0, win1 = evaluate(always_roll(1), always_roll(1), 10)
+    >>> win0 == win1
+    True
+    >>> round(win0[0][0], 4)
+    0.5458
+    """
+    policy0, policy1 = tabulate(strategy0, goal), tabulate(strategy1, goal)
+    four_sided, six_sided = turn_distributions(4), turn_distributions(6)
+    win0 = [[0.0] * goal for _ in range(goal)]
+    win1 = [[0.0] * goal for _ in range(goal)]
+    for score, opponent_score in states_by_sum(goal):
+        if (score + opponent_score) % 7 == 0:
+            distributions = four_sided
+        else:
+            distributions = six_sided
+        for policy, win, other_win in ((policy0, win0, win1),
+                                       (policy1, win1, win0)):
+            num_rolls = policy(score, opponent_score)
+            if num_rolls == 0:
+                outcomes = [(take_bacon(opponent_score), 1.0)]
+            else:
+                outcomes = distributions[num_rolls]
+            win[score][opponent_score] = sum(
+                p * turn_value(score, opponent_score, x, other_win, goal)
+                for x, p in outcomes)
+    return win0, win1
+
+def win_probability(strategy0, strategy1, goal=GOAL_SCORE):
+    """The exact chance that STRATEGY0 wins a game of play against STRATEGY1
+    when STRATEGY0 goes first.
+
+    >>> round(win_probability(always_roll(5), always_roll(5)), 6)
+    0.499035
+    """
+    win0, _ = evaluate(strategy0, strategy1, goal)
+    return win0[0][0]
+
+def win_rate(strategy, baseline=always_roll(BASELINE_NUM_ROLLS),
+             goal=GOAL_SCORE):
+    """The exact chance (0 to 1) that STRATEGY wins against BASELINE, averaged
+    over both orders of play; average_win_rate estimates the same chance.
+
+    >>> round(win_rate(always_roll(5)), 6)
+    0.5
+    >>> round(win_rate(optimal_strategy), 4)
+    0.7208
+    """
+    win0, win1 = evaluate(strategy, baseline, goal)
+    return (win0[0][0] + 1 - win1[0][0]) / 2
+
+def write_policy(policy, f):
+    """Write POLICY to the file F as one line of digits per score, with a for
+    10 rolls.
+
+    >>> import io
+    >>> f = io.StringIO()
+    >>> write_policy([[10, 0], [5, 6]], f)
+    >>> f.getvalue()
+    'a0\\n56\\n'
+    >>> list(read_policy(io.StringIO(f.getvalue()))[0])
+    [10, 0]
+    """
+    for row in policy:
+        f.write(''.join(ROLL_DIGITS[num_rolls] for num_rolls in row) + '\n')
+
+def read_policy(f):
+    """Return a TableStrategy of a policy written by write_policy to the file
+    F."""
+    return TableStrategy([[ROLL_DIGITS.index(c) for c in line.strip()]
+                          for line in f if line.strip()])
+
+_optimal_policy = None
+
+def optimal_strategy(score, opponent_score):
+    """The optimal strategy for reaching GOAL_SCORE, solved on first use.
+
+    >>> optimal_strategy(0, 0)
+    4
+    >>> optimal_strategy(99, 0) # Free Bacon wins the game
+    0
+    """
+    global _optimal_policy
+    if _optimal_policy is None:
+        _optimal_policy, _ = solve()
+    return _optimal_policy(score, opponent_score)
+
+@main
+def run(*args):
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Solve the game of Hog")
+    parser.add_argument('--goal', '-g', type=int, default=GOAL_SCORE,
+                        help='Score needed to win')
+    parser.add_argument('--output', '-o', type=str,
+                        help='Write the optimal policy to this file')
+    parser.add_argument('--compare', '-c', action='store_true',
+                        help='Report the win rates of the strategies in hog')
+    args = parser.parse_args(args)
+
+    start = time.perf_counter()
+    policy, win = solve(args.goal)
+    print('Solved {0} states in {1:.2f}s'.format(
+        args.goal ** 2, time.perf_counter() - start))
+    print('The first player wins with probability {0:.6f}'.format(win[0][0]))
+    if args.output:
+        with open(args.output, 'w') as f:
+            write_policy(policy, f)
+    if args.compare:
+        import hog
+        for name in ('bacon_strategy', 'swap_strategy', 'final_strategy'):
+            print('{0} win rate: {1:.6f}'.format(
+                name, win_rate(getattr(hog, name), goal=args.goal)))
+        print('optimal win rate: {0:.6f}'.format(
+            win_rate(policy, goal=args.goal)))
@@ -0,0 +1,152 @@
+"""A round-robin tournament between strategies for Hog.
+
+Usage: python3 hog_tournament.py [--cache FILE] [--processes P]
+
+Every pair of strategies is evaluated exactly by hog_solver.evaluate, which
+gives the chance of winning for each strategy when it goes first.  Results
+are cached in a file, keyed by the digests of the tabulated strategies, so
+that adding a strategy to a tournament only evaluates its own games.
+"""
+
+import json
+import os
+from hog import GOAL_SCORE
+from hog_solver import evaluate, tabulate
+from ucb import main
+
+DEFAULT_CACHE = 'hog_tournament.json'
+
+class ResultCache:
+    """The chances that each of a pair of tables wins when it goes first,
+    stored in the JSON file FILENAME, if there is one.
+
+    >>> from hog import always_roll
+    >>> cache = ResultCache()
+    >>> one, two = tabulate(always_roll(1)), tabulate(always_roll(2))
+    >>> cache.put(one, two, (0.25, 0.5))
+    >>> cache.get(two, one), cache.get(one, one)
+    ((0.5, 0.25), None)
+    """
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.results = {}
+        if filename and os.path.exists(filename):
+            with open(filename) as f:
+                self.results = json.load(f)
+
+    def get(self, table0, table1):
+        """The chances (p0, p1) that TABLE0 and TABLE1 each win when they go
+        first against the other, or None if they are not known."""
+        result = self.results.get(table0.digest + ':' + table1.digest)
+        if result is not None:
+            return tuple(result)
+        result = self.results.get(table1.digest + ':' + table0.digest)
+        if result is not None:
+            return tuple(reversed(result))
+
+    def put(self, table0, table1, result):
+        self.results[table0.digest + ':' + table1.digest] = list(result)
+
+    def save(self):
+        """Write the results to the file, replacing it only once complete."""
+        if self.filename:
+            with open(self.filename + '.tmp', 'w') as f:
+                json.dump(self.results, f)
+            os.replace(self.filename + '.tmp', self.filename)
+
+def _evaluate_pair(pair):
+    table0, table1, goal = pair
+    win0, win1 = evaluate(table0, table1, goal)
+    return win0[0][0], win1[0][0]
+
+def play_tournament(strategies, cache=None, processes=None, goal=GOAL_SCORE):
+    """Return a dict FIRST such that FIRST[a][b] is the chance that the
+    strategy named a wins when it goes first against the strategy named b,
+    for STRATEGIES, a dict of names and strategies.  Pairs of strategies not
+    in the ResultCache CACHE are evaluated across PROCESSES processes and
+    added to it.
+
+    >>> from hog import always_roll
+    >>> strategies = {'one': always_roll(1), 'ten': always_roll(10)}
+    >>> first = play_tournament(strategies, processes=1, goal=20)
+    >>> round(first['one']['ten'], 4), round(first['ten']['one'], 4)
+    (0.3704, 0.638)
+    """
+    if cache is None:
+        cache = ResultCache()
+    names = list(strategies)
+    tables = {name: tabulate(strategies[name], goal) for name in names}
+    pairs = []  # Pairs of tables that have not been evaluated
+    for i, name0 in enumerate(names):
+        for name1 in names[i:]:
+            table0, table1 = tables[name0], tables[name1]
+            pending = (table0, table1, goal) in pairs or (
+                table1, table0, goal) in pairs
+            if cache.get(table0, table1) is None and not pending:
+                pairs.append((table0, table1, goal))
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or len(pairs) < 2:
+        results = map(_evaluate_pair, pairs)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_evaluate_pair, pairs))
+    for (table0, table1, _), result in zip(pairs, results):
+        cache.put(table0, table1, result)
+    cache.save()
+    return {name0: {name1: cache.get(tables[name0], tables[name1])[0]
+                    for name1 in names}
+            for name0 in names}
+
+def rank(first):
+    """Return a list of (name, win rate) pairs, from the best strategy to the
+    worst, where the win rate of each strategy is averaged over both orders
+    of play against each other strategy in the tournament results FIRST.
+    A strategy alone in a tournament is ranked by its games against itself.
+
+    >>> rank({'a': {'a': 0.5, 'b': 0.75}, 'b': {'a': 0.25, 'b': 0.5}})
+    [('a', 0.75), ('b', 0.25)]
+    >>> rank({'a': {'a': 0.625}})
+    [('a', 0.5)]
+    """
+    rates = []
+    for name, results in first.items():
+        others = [other for other in first if other != name] or [name]
+        total = sum(results[other] + 1 - first[other][name]
+                    for other in others)
+        rates.append((name, total / (2 * len(others))))
+    return sorted(rates, key=lambda rate: -rate[1])
+
+def default_strategies():
+    """The strategies of hog and hog_solver, and always_roll for each number
+    of dice."""
+    import hog
+    from hog_solver import optimal_strategy
+    strategies = {'always_roll({0})'.format(n): hog.always_roll(n)
+                  for n in range(11)}
+    for name in ('bacon_strategy', 'swap_strategy', 'final_strategy'):
+        strategies[name] = getattr(hog, name)
+    strategies['optimal_strategy'] = optimal_strategy
+    return strategies
+
+@main
+def run(*args):
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Rank strategies for Hog")
+    parser.add_argument('--cache', '-c', type=str, default=DEFAULT_CACHE,
+                        help='File of cached results (default: {0})'.format(
+                            DEFAULT_CACHE))
+    parser.add_argument('--processes', '-p', type=int,
+                        help='Number of processes (default: one per CPU)')
+    args = parser.parse_args(args)
+
+    start = time.perf_counter()
+    cache = ResultCache(args.cache)
+    known = len(cache.results)
+    first = play_tournament(default_strategies(), cache, args.processes)
+    print('Evaluated {0} new pairs in {1:.2f}s'.format(
+        len(cache.results) - known, time.perf_counter() - start))
+    for place, (name, rate) in enumerate(rank(first), 1):
+        print('{0:3}. {1:<18} {2:.4f}'.format(place, name, rate))
@@ -1,6 +1,10 @@
 """The buffer module assists in iterating through lines and tokens."""
 
 import math
+from collections import deque
+
+HISTORY_LINES = 4  # Lines kept for error messages, including the current line
+HISTORY_INPUTS = 1000  # Interactive inputs kept in readline's history
 
 class Buffer:
     """A Buffer provides a way of accessing a sequence of tokens across lines.
@@ -16,8 +20,9 @@ class Buffer:
     In addition, Buffer provides a current method to look at the
     next item to be supplied, without sequencing past it.
 
-    The __str__ method prints all tokens read so far, up to the end of the
-    current line, and marks the current token with >>.
+    The __str__ method prints the tokens of the current line and up to three
+    lines before it, and marks the current token with >>.  Only those lines are
+    kept, so a Buffer uses constant memory however many lines it reads.
 
     >>> buf = Buffer(iter([['(', '+'], [15], [12, ')']]))
     >>> buf.pop()
@@ -46,10 +51,21 @@ class Buffer:
     2: 15
     3: 12 ) >>
     >>> buf.pop()  # returns None
+    >>> buf = Buffer(iter([[k] for k in range(1, 13)]))
+    >>> for _ in range(10):
+    ...     _ = buf.pop()
+    >>> buf.current()
+    11
+    >>> print(buf)
+    8: 8
+     9: 9
+    10: 10
+    11:  >> 11
     """
     def __init__(self, source):
         self.index = 0
-        self.lines = []
+        self.lines = deque(maxlen=HISTORY_LINES)
+        self.line_count = 0
         self.source = source
         self.current_line = ()
         self.current()
@@ -72,6 +88,7 @@ class Buffer:
             try:
                 self.current_line = next(self.source)
                 self.lines.append(self.current_line)
+                self.line_count += 1
             except StopIteration:
                 self.current_line = ()
                 return None
@@ -80,24 +97,29 @@ class Buffer:
     def __str__(self):
         """Return recently read contents; current element marked with >>."""
         # Format string for right-justified line numbers
-        n = len(self.lines)
+        n = self.line_count
         msg = '{0:>' + str(math.floor(math.log10(n))+1) + "}: "
 
         # Up to three previous lines and current line are included in output
         s = ''
-        for i in range(max(0, n-4), n-1):
-            s += msg.format(i+1) + ' '.join(map(str, self.lines[i])) + '\n'
+        previous = list(self.lines)[:-1]
+        for i, line in enumerate(previous, n - len(previous)):
+            s += msg.format(i) + ' '.join(map(str, line)) + '\n'
         s += msg.format(n)
         s += ' '.join(map(str, self.current_line[:self.index]))
         s += ' >> '
         s += ' '.join(map(str, self.current_line[self.index:]))
         return s.strip()
 
-# Try to import readline for interactive history
-try:
-    import readline
-except:
-    pass
+def load_readline():
+    """Try to import readline for interactive history, returning the module
+    or None.  Only interactive sessions need it, so it is imported on the first
+    prompt."""
+    try:
+        import readline
+    except:
+        return None
+    return readline
 
 class InputReader:
     """An InputReader is an iterable that prompts the user for input."""
@@ -105,20 +127,30 @@ class InputReader:
         self.prompt = prompt
 
     def __iter__(self):
+        readline = load_readline()
         while True:
             yield input(self.prompt)
             self.prompt = ' ' * len(self.prompt)
+            if readline is not None:
+                # Forget the oldest inputs, so that history stays bounded
+                while readline.get_current_history_length() > HISTORY_INPUTS:
+                    readline.remove_history_item(0)
 
 class LineReader:
-    """A LineReader is an iterable that prints lines after a prompt."""
+    """A LineReader is an iterable that prints lines after a prompt.
+
+    LINES is an iterator, such as an open file, from which each line is read
+    as it is needed.  Successive LineReaders on the same iterator continue
+    where the last one stopped.
+    """
     def __init__(self, lines, prompt, comment=";"):
-        self.lines = lines
+        self.lines = iter(lines)
         self.prompt = prompt
         self.comment = comment
 
     def __iter__(self):
-        while self.lines:
-            line = self.lines.pop(0).strip('\n')
+        for line in self.lines:
+            line = line.strip('\n')
             if (self.prompt is not None and line != "" and
                 not line.lstrip().startswith(self.comment)):
                 print(self.prompt + line)
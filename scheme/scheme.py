@@ -4,7 +4,11 @@ eval/apply mutual recurrence, environment model, and read-eval-print loop.
 
 from scheme_primitives import *
 from scheme_reader import *
+from scheme_reader import _cons_key
 from ucb import main, trace
+from collections import OrderedDict
+import os
+import scheme_ports
 
 ##############
 # Eval/Apply #
@@ -25,7 +29,8 @@ def scheme_eval(expr, env):
     # Evaluate Atoms
     if scheme_symbolp(expr):
         return env.lookup(expr)
-    elif scheme_atomp(expr) or scheme_stringp(expr) or expr is okay:
+    elif (scheme_atomp(expr) or scheme_stringp(expr) or expr is okay or
+          scheme_vectorp(expr) or scheme_hash_tablep(expr)):
         return expr
 
     # All non-atomic expressions are lists.
@@ -43,11 +48,18 @@ def scheme_eval(expr, env):
         return do_mu_form(rest)
     elif first == "define":
         return do_define_form(rest, env)
+    elif first == "define-memo":
+        return do_define_memo_form(rest, env)
+    elif first == "future":
+        return do_future_form(rest, env)
     elif first == "quote":
         return do_quote_form(rest)
     elif first == "let":
         expr, env = do_let_form(rest, env)
         return scheme_eval(expr, env)
+    elif first == "do":
+        expr, env = do_do_form(rest, env)
+        return scheme_eval(expr, env)
     else:
         procedure = scheme_eval(first, env)
         args = rest.map(lambda operand: scheme_eval(operand, env))
@@ -55,17 +67,68 @@ def scheme_eval(expr, env):
 
 def scheme_apply(procedure, args, env):
     """Apply Scheme PROCEDURE to argument values ARGS in environment ENV."""
+    if _steps_left is not None:
+        take_step()
     if isinstance(procedure, PrimitiveProcedure):
         return apply_primitive(procedure, args, env)
     elif isinstance(procedure, LambdaProcedure):
         frame = procedure.env.make_call_frame(procedure.formals, args)
+        frame.info = procedure.info
         return scheme_eval(procedure.body, frame)
     elif isinstance(procedure, MuProcedure):
-        frame = env.make_call_frame(procedure.formals, args)
-        return scheme_eval(procedure.body, frame)
+        if not shallow_mu_binding:
+            frame = env.make_call_frame(procedure.formals, args)
+            return scheme_eval(procedure.body, frame)
+        frame = env.make_call_frame(procedure.formals, args, MuFrame(env))
+        frame.enter()
+        try:
+            return scheme_eval(procedure.body, frame)
+        finally:
+            frame.exit()
+    elif isinstance(procedure, MemoProcedure):
+        key = tuple(_memo_key(arg) for arg in args)
+        try:
+            return procedure.lookup(key)
+        except KeyError:
+            val = scheme_apply(procedure.procedure, args, env)
+            procedure.store(key, val)
+            return val
+        except TypeError:  # Unhashable arguments, such as vectors
+            return scheme_apply(procedure.procedure, args, env)
     else:
         raise SchemeError("Cannot call {0}".format(str(procedure)))
 
+_steps_left = None
+
+def take_step():
+    """Count one step (a procedure application or loop iteration) against the
+    step budget."""
+    global _steps_left
+    if _steps_left is not None:
+        if _steps_left <= 0:
+            raise SchemeError("step budget exhausted")
+        _steps_left -= 1
+
+def set_step_budget(steps):
+    """Limit the number of procedure applications to STEPS (None for no limit),
+    after which scheme_apply raises a SchemeError. Returns the steps that were
+    left under the previous budget.
+
+    >>> env = create_global_frame()
+    >>> old = set_step_budget(2)
+    >>> scheme_eval(read_line("(+ 1 (* 2 3))"), env)
+    7
+    >>> scheme_eval(read_line("(+ 1 2)"), env)
+    Traceback (most recent call last):
+        ...
+    scheme_primitives.SchemeError: step budget exhausted
+    >>> set_step_budget(old)
+    0
+    """
+    global _steps_left
+    old, _steps_left = _steps_left, steps
+    return old
+
 def apply_primitive(procedure, args, env):
     """Apply PrimitiveProcedure PROCEDURE to a Scheme list of ARGS in ENV.
 
@@ -91,6 +154,9 @@ def apply_primitive(procedure, args, env):
 class Frame:
     """An environment frame binds Scheme symbols to Scheme values."""
 
+    frozen = False
+    info = None  # The _BodyInfo of the body evaluated in a local frame
+
     def __init__(self, parent):
         """An empty frame with a PARENT frame (that may be None)."""
         self.bindings = {}
@@ -129,24 +195,26 @@ class Frame:
 
 
     def global_frame(self):
-        """The global environment at the root of the parent chain."""
+        """The global environment at the root of the parent chain, not counting
+        a frozen frame shared by several global environments."""
         e = self
-        while e.parent is not None:
+        while e.parent is not None and not e.parent.frozen:
             e = e.parent
         return e
 
-    def make_call_frame(self, formals, vals):
+    def make_call_frame(self, formals, vals, frame=None):
         """Return a new local frame whose parent is SELF, in which the symbols
         in the Scheme formal parameter list FORMALS are bound to the Scheme
         values in the Scheme value list VALS. Raise an error if too many or too
-        few arguments are given.
+        few arguments are given.  FRAME, if given, is the new empty frame.
 
         >>> env = create_global_frame()
         >>> formals, vals = read_line("(a b c)"), read_line("(1 2 3)")
         >>> env.make_call_frame(formals, vals)
         <{a: 1, b: 2, c: 3} -> <Global Frame>>
         """
-        frame = Frame(self)
+        if frame is None:
+            frame = Frame(self)
         check_formals(formals)
         num_formals = len(formals)
         num_vals = len(vals)
@@ -163,9 +231,114 @@ class Frame:
         """Define Scheme symbol SYM to have value VAL in SELF."""
         self.bindings[sym] = val
 
+class FrozenFrame(Frame):
+    """A read-only frame that can be shared as the parent of several global
+    frames, such as the primitives and prelude of independent sessions.
+
+    >>> base = FrozenFrame(create_global_frame())
+    >>> env = Frame(base)
+    >>> scheme_eval(read_line("(define x (+ 1 2))"), env)
+    'x'
+    >>> env.global_frame() is env
+    True
+    >>> base.define("x", 3)
+    Traceback (most recent call last):
+        ...
+    scheme_primitives.SchemeError: cannot define x in a frozen frame
+    """
+
+    frozen = True
+
+    def __init__(self, frame):
+        """A frozen copy of the bindings of FRAME and its parents."""
+        Frame.__init__(self, None)
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.parent
+        for f in reversed(frames):
+            self.bindings.update(f.bindings)
+
+    def define(self, sym, val):
+        raise SchemeError("cannot define {0} in a frozen frame".format(sym))
+
+# Whether mu procedures use shallow binding (MuFrame) rather than looking up
+# names through the frames of all of their dynamic callers.
+shallow_mu_binding = True
+
+class _DynamicCells:
+    """The current values of the names bound by a run of nested mu calls, and
+    the innermost frame of the run."""
+    def __init__(self):
+        self.values = {}
+        self.top = None
+
+_UNBOUND = object()
+
+class MuFrame(Frame):
+    """The frame of a mu procedure call, which uses shallow binding.
+
+    Consecutive mu calls, each made from the body of the one before, share one
+    table of value cells.  Entering a call saves the previous values of the
+    names it binds and stores its own values; exiting restores them.  While a
+    frame is the innermost of its run, it looks names up in the table in
+    constant time, however deep the run; otherwise (as when used by a closure
+    after the call has returned) it looks names up through its parents.
+
+    >>> env = create_global_frame()
+    >>> define_f = "(define f (mu (n) (if (= n 0) y (f (- n 1)))))"
+    >>> scheme_eval(read_line(define_f), env)
+    'f'
+    >>> scheme_eval(read_line("((lambda (y) (f 50)) 7)"), env)
+    7
+    """
+
+    def __init__(self, parent):
+        Frame.__init__(self, parent)
+        if isinstance(parent, MuFrame) and parent.cells.top is parent:
+            self.cells, self.base = parent.cells, parent.base
+        else:
+            self.cells, self.base = _DynamicCells(), parent
+        self.saved = None
+
+    def enter(self):
+        """Make this frame the innermost of its run."""
+        cells = self.cells
+        self.saved = [(sym, cells.values.get(sym, _UNBOUND))
+                      for sym in self.bindings]
+        cells.values.update(self.bindings)
+        self.saved_top, cells.top = cells.top, self
+
+    def exit(self):
+        """Restore the values of its run from before enter."""
+        values = self.cells.values
+        for sym, val in reversed(self.saved):
+            if val is _UNBOUND:
+                del values[sym]
+            else:
+                values[sym] = val
+        self.cells.top = self.saved_top
+
+    def lookup(self, symbol):
+        if self.cells.top is self:
+            try:
+                return self.cells.values[symbol]
+            except KeyError:
+                return self.base.lookup(symbol)
+        return Frame.lookup(self, symbol)
+
+    def define(self, sym, val):
+        cells = self.cells
+        if cells.top is self:
+            self.saved.append((sym, cells.values.get(sym, _UNBOUND)))
+            cells.values[sym] = val
+        self.bindings[sym] = val
+
 class LambdaProcedure:
     """A procedure defined by a lambda expression or the complex define form."""
 
+    info = None  # The _BodyInfo of its body, if known
+
     def __init__(self, formals, body, env):
         """A procedure whose formal parameter list is FORMALS (a Scheme list),
         whose body is the single Scheme expression BODY, and whose parent
@@ -210,6 +383,93 @@ class MuProcedure:
         args = (self.formals, self.body)
         return "MuProcedure({0}, {1})".format(*(repr(a) for a in args))
 
+class MemoProcedure:
+    """A procedure that caches the values returned by PROCEDURE, keyed on the
+    argument values, discarding the least recently used values once more than
+    MAX_SIZE (default: no limit) are cached.  Pair arguments are compared
+    structurally, as by equal?.
+
+    >>> env = create_global_frame()
+    >>> f = scheme_memoize(scheme_eval(read_line("(lambda (x) x)"), env), 1)
+    >>> scheme_apply(f, read_line("((1 2))"), env)
+    Pair(1, Pair(2, nil))
+    >>> scheme_apply(f, read_line("((1 2))"), env)
+    Pair(1, Pair(2, nil))
+    >>> scheme_apply(f, read_line("(3)"), env)
+    3
+    >>> print(scheme_memo_stats(f))
+    ((hits . 1) (misses . 2) (evictions . 1) (size . 1))
+    """
+
+    def __init__(self, procedure, max_size=None):
+        self.procedure = procedure
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def lookup(self, key):
+        """Return the cached value for the argument tuple KEY.  Raises KeyError
+        if no value is cached, or TypeError if KEY is unhashable."""
+        try:
+            val = self.cache[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self.cache.move_to_end(key)
+        return val
+
+    def store(self, key, val):
+        """Cache VAL for KEY, evicting the least recently used value if the
+        cache is full."""
+        self.cache[key] = val
+        if self.max_size is not None and len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def __str__(self):
+        return "(memoize {0})".format(str(self.procedure))
+
+    def __repr__(self):
+        args = (self.procedure, self.max_size)
+        return "MemoProcedure({0}, {1})".format(*(repr(a) for a in args))
+
+def _memo_key(value):
+    """A hashable key for the argument VALUE of a MemoProcedure, which tells
+    apart values of different types, such as 1, 1.0 and #t, even within pairs.
+
+    >>> _memo_key(1) == _memo_key(True)
+    False
+    >>> _memo_key(read_line("(1 (2))")) == _memo_key(read_line("(1 (2))"))
+    True
+    """
+    if not isinstance(value, Pair):
+        return _cons_key(value)
+    items = []
+    while isinstance(value, Pair):
+        items.append(_memo_key(value.first))
+        value = value.second
+    return (Pair, tuple(items), _memo_key(value))
+
+def scheme_memoize(procedure, max_size=None):
+    """Return a MemoProcedure caching up to MAX_SIZE values of PROCEDURE."""
+    check_type(procedure, lambda p: isinstance(p, LambdaProcedure), 0,
+               "memoize")
+    if max_size is not None:
+        check_type(max_size, scheme_integerp, 1, "memoize")
+        if max_size < 1:
+            raise SchemeError("memoize: max-size must be positive")
+    return MemoProcedure(procedure, max_size)
+
+def scheme_memo_stats(procedure):
+    """An association list of cache statistics for a MemoProcedure."""
+    check_type(procedure, lambda p: isinstance(p, MemoProcedure), 0,
+               "memo-stats")
+    stats = (("hits", procedure.hits), ("misses", procedure.misses),
+             ("evictions", procedure.evictions),
+             ("size", len(procedure.cache)))
+    return scheme_list(*(Pair(name, n) for name, n in stats))
+
 
 #################
 # Special forms #
@@ -220,12 +480,15 @@ def do_lambda_form(vals, env):
     check_form(vals, 2)
     formals = vals[0]
     check_formals(formals)
+    info = body_info(formals, vals.second)
     body = vals.second
     if len(body) > 1:
         body = Pair('begin', body)
     else:
         body = body.first
-    return LambdaProcedure(formals, body, env)
+    procedure = LambdaProcedure(formals, body, flat_closure_env(info, env))
+    procedure.info = info
+    return procedure
 
 def do_mu_form(vals):
     """Evaluate a mu form with parameters VALS."""
@@ -260,6 +523,17 @@ def do_define_form(vals, env):
     else:
         raise SchemeError("bad argument to define")
 
+def do_define_memo_form(vals, env):
+    """Evaluate a define-memo form with parameters VALS in environment ENV,
+    which defines a memoized procedure as (define-memo (name formals) body)."""
+    check_form(vals, 2)
+    target = vals[0]
+    if not isinstance(target, Pair):
+        raise SchemeError("bad argument to define-memo")
+    name = do_define_form(vals, env)
+    env.define(name, scheme_memoize(env.lookup(name)))
+    return name
+
 def do_quote_form(vals):
     """Evaluate a quote form with parameters VALS."""
     check_form(vals, 1, 1)
@@ -268,6 +542,8 @@ def do_quote_form(vals):
 def do_let_form(vals, env):
     """Evaluate a let form with parameters VALS in environment ENV."""
     check_form(vals, 2)
+    if scheme_symbolp(vals.first):
+        return do_named_let_form(vals, env)
     bindings = vals[0]
     exprs = vals.second
     if not scheme_listp(bindings):
@@ -282,6 +558,7 @@ def do_let_form(vals, env):
         names = Pair(name, names)
         values = Pair(value, values)
     new_env = env.make_call_frame(names, values)
+    new_env.info = body_info(names, exprs)
 
     # Evaluate all but the last expression after bindings, and return the last
     last = len(exprs)-1
@@ -289,6 +566,107 @@ def do_let_form(vals, env):
         scheme_eval(exprs[i], new_env)
     return exprs[last], new_env
 
+def do_named_let_form(vals, env):
+    """Evaluate a named let form (let NAME ((VAR INIT) ...) BODY ...) with
+    parameters VALS in environment ENV.  BODY is evaluated with NAME bound to
+    a procedure of the VARs, called first with the values of the INITs.
+
+    If BODY calls NAME only in tail position and creates no closures, the loop
+    is compiled (see _compile) and runs in one frame whose bindings are updated
+    on each call.
+
+    >>> env = create_global_frame()
+    >>> expr = "(let loop ((i 0) (total 0)) (if (> i 4) total (loop (+ i 1) (+ total i))))"
+    >>> scheme_eval(read_line(expr), env)
+    10
+    """
+    check_form(vals, 3)
+    name, bindings, body = vals.first, vals[1], vals.second.second
+    params, args = _loop_bindings(bindings, 2, env, "let")
+    code = _loop_code(vals, _compile_named_let)
+    if code is None:
+        loop_env = Frame(env)
+        procedure = do_lambda_form(Pair(params, body), loop_env)
+        loop_env.define(name, procedure)
+        frame = loop_env.make_call_frame(params, args)
+        frame.info = procedure.info
+        return procedure.body, frame
+
+    frame = env.make_call_frame(params, args)
+    frame.info = body_info(params, body)
+    exprs, last = code
+    while True:
+        if _steps_left is not None:
+            take_step()
+        for expr in exprs:
+            expr(frame)
+        value = last(frame)
+        if value is not _REPEAT:
+            return quote(value), frame
+
+def do_do_form(vals, env):
+    """Evaluate a do loop (do ((VAR INIT STEP) ...) (TEST EXPR ...) COMMAND ...)
+    with parameters VALS in environment ENV.  Until TEST is true, the COMMANDs
+    are evaluated and each VAR with a STEP is bound to its value; then the
+    EXPRs are evaluated and the last is returned.
+
+    Each iteration binds the VARs in a new frame, unless the loop creates no
+    closures that could keep the frame, in which case the loop is compiled
+    and updates one frame.
+
+    >>> env = create_global_frame()
+    >>> expr = "(do ((i 0 (+ i 1)) (acc nil (cons i acc))) ((= i 3) acc))"
+    >>> scheme_eval(read_line(expr), env)
+    Pair(2, Pair(1, Pair(0, nil)))
+    """
+    check_form(vals, 2)
+    check_form(vals[1], 1)
+    specs, (test, *exprs), commands = vals.first, vals[1], vals.second.second
+    params, args = _loop_bindings(specs, 3, env, "do")
+    info = body_info(params, vals.second)
+    frame = env.make_call_frame(params, args)
+    frame.info = info
+    code = _loop_code(vals, _compile_do)
+    if code is not None:
+        test_code, command_code, step_code = code
+        while not scheme_true(test_code(frame)):
+            if _steps_left is not None:
+                take_step()
+            for command in command_code:
+                command(frame)
+            frame.bindings.update([(sym, step(frame))
+                                   for sym, step in step_code])
+    else:
+        steps = [(spec.first, spec[2]) for spec in specs if len(spec) == 3]
+        while not scheme_true(scheme_eval(test, frame)):
+            take_step()
+            for command in commands:
+                scheme_eval(command, frame)
+            values = [(sym, scheme_eval(step, frame)) for sym, step in steps]
+            bindings, frame = frame.bindings, Frame(env)
+            frame.bindings.update(bindings)
+            frame.bindings.update(values)
+            frame.info = info
+    if not exprs:
+        return okay, frame
+    for expr in exprs[:-1]:
+        scheme_eval(expr, frame)
+    return exprs[-1], frame
+
+def _loop_bindings(bindings, max_length, env, form):
+    """The Scheme list of names bound by the list BINDINGS of a loop form, and
+    the Scheme list of values of their initial expressions in ENV."""
+    if not scheme_listp(bindings):
+        raise SchemeError("bad bindings list in {0} form".format(form))
+    names, values = [], []
+    for binding in bindings:
+        check_form(binding, 2, max_length)
+        names.append(binding.first)
+        values.append(scheme_eval(binding[1], env))
+    names = scheme_list(*names)
+    check_formals(names)
+    return names, scheme_list(*values)
+
 
 #########################
 # Logical Special Forms #
@@ -440,7 +818,8 @@ def scheme_optimized_eval(expr, env):
         # Evaluate Atoms
         if scheme_symbolp(expr):
             return env.lookup(expr)
-        elif scheme_atomp(expr) or scheme_stringp(expr) or expr is okay:
+        elif (scheme_atomp(expr) or scheme_stringp(expr) or expr is okay or
+              scheme_vectorp(expr) or scheme_hash_tablep(expr)):
             return expr
 
         # All non-atomic expressions are lists.
@@ -458,10 +837,16 @@ def scheme_optimized_eval(expr, env):
             return do_mu_form(rest)
         elif first == "define":
             return do_define_form(rest, env)
+        elif first == "define-memo":
+            return do_define_memo_form(rest, env)
+        elif first == "future":
+            return do_future_form(rest, env)
         elif first == "quote":
             return do_quote_form(rest)
         elif first == "let":
             "*** YOUR CODE HERE ***"
+        elif first == "do":
+            expr, env = do_do_form(rest, env)
         else:
             "*** YOUR CODE HERE ***"
 
@@ -471,6 +856,653 @@ def scheme_optimized_eval(expr, env):
 # scheme_eval = scheme_optimized_eval
 
 
+##################
+# Free Variables #
+##################
+
+def free_variables(expr, bound=frozenset(), calls=None):
+    """Return the set of symbols that occur free in EXPR, not counting those in
+    BOUND or the names of special forms.  If CALLS is a set, the free symbols
+    called as procedures are added to it, along with None if a procedure is
+    called by any other expression.  Raises a SchemeError if EXPR contains a
+    special form too malformed to tell which names it binds.
+
+    >>> sorted(free_variables(read_line("(lambda (x) (f x y))")))
+    ['f', 'y']
+    >>> sorted(free_variables(read_line("(let ((a b)) (define c a) (g a c))")))
+    ['b', 'g']
+    >>> sorted(free_variables(read_line("(cond ((p x) 'y) (else z))")))
+    ['p', 'x', 'z']
+    >>> sorted(free_variables(read_line("(let f ((i n)) (if (> i m) i (f (g i))))")))
+    ['>', 'g', 'm', 'n']
+    >>> sorted(free_variables(read_line("(do ((i 0 (+ i k))) ((= i n) s))")))
+    ['+', '=', 'k', 'n', 's']
+    >>> calls = set()
+    >>> sorted(free_variables(read_line("(lambda (f) (g (f x)))"), (), calls))
+    ['g', 'x']
+    >>> calls == {'g', None}
+    True
+    >>> free_variables(read_line("(let (x) x)"))
+    Traceback (most recent call last):
+        ...
+    scheme_primitives.SchemeError: badly formed expression: x
+    """
+    free = set()
+    if calls is None:
+        calls = set()
+    _add_free_variables(expr, set(bound), free, calls)
+    return free
+
+def _binding_names(bindings, min, max):
+    """The names bound by the Scheme list BINDINGS of a let or do form, each a
+    list of MIN to MAX elements beginning with a symbol."""
+    if not scheme_listp(bindings):
+        raise SchemeError("bad bindings list: " + str(bindings))
+    names = set()
+    for binding in bindings:
+        check_form(binding, min, max)
+        if not scheme_symbolp(binding.first):
+            raise SchemeError("invalid symbol: " + str(binding.first))
+        names.add(binding.first)
+    return names
+
+def _add_free_variables(expr, bound, free, calls):
+    """Add the symbols occurring free in EXPR but not in BOUND to FREE, and
+    the procedures it calls to CALLS."""
+    if scheme_symbolp(expr):
+        if expr not in bound:
+            free.add(expr)
+        return
+    if not isinstance(expr, Pair) or not scheme_listp(expr):
+        return
+    first, rest = expr.first, expr.second
+    if first in ("lambda", "mu"):
+        check_form(rest, 2)
+        check_formals(rest.first)
+        inner = bound | set(rest.first)
+        _add_body_free_variables(rest.second, inner, free, calls)
+    elif first in ("define", "define-memo"):
+        check_form(rest, 2)
+        target = rest.first
+        if isinstance(target, Pair):
+            check_formals(target)
+            bound.add(target.first)
+            inner = bound | set(target.second)
+            _add_body_free_variables(rest.second, inner, free, calls)
+        elif scheme_symbolp(target):
+            bound.add(target)
+            _add_body_free_variables(rest.second, bound, free, calls)
+        else:
+            raise SchemeError("bad argument to define")
+    elif (first == "let" and isinstance(rest, Pair) and
+          scheme_symbolp(rest.first)):
+        check_form(rest, 3)  # A named let
+        bindings, body = rest.second.first, rest.second.second
+        names = _binding_names(bindings, 2, 2) | {rest.first}
+        for binding in bindings:
+            _add_body_free_variables(binding.second, bound, free, calls)
+        _add_body_free_variables(body, bound | names, free, calls)
+    elif first == "let":
+        check_form(rest, 2)
+        names = _binding_names(rest.first, 2, 2)
+        for binding in rest.first:
+            _add_body_free_variables(binding.second, bound, free, calls)
+        _add_body_free_variables(rest.second, bound | names, free, calls)
+    elif first == "do":
+        check_form(rest, 2)
+        check_form(rest[1], 1)
+        inner = bound | _binding_names(rest.first, 2, 3)
+        for spec in rest.first:
+            _add_free_variables(spec[1], bound, free, calls)
+            _add_body_free_variables(spec.second.second, inner, free, calls)
+        _add_body_free_variables(rest.second, inner, free, calls)
+    elif first == "cond":
+        for clause in rest:
+            check_form(clause, 1)
+            if clause.first != "else":
+                _add_free_variables(clause.first, bound, free, calls)
+            _add_body_free_variables(clause.second, bound, free, calls)
+    elif first == "quote":
+        return
+    elif first in LOGIC_FORMS or first == "future":
+        _add_body_free_variables(rest, bound, free, calls)
+    else:
+        if scheme_symbolp(first) and first not in bound:
+            calls.add(first)
+        else:
+            calls.add(None)
+        _add_body_free_variables(expr, bound, free, calls)
+
+def _add_body_free_variables(body, bound, free, calls):
+    """Add the free symbols of the expressions in the Scheme list BODY to FREE.
+    Names defined in BODY are bound throughout it."""
+    bound = set(bound)
+    for expr in body:
+        if (isinstance(expr, Pair) and expr.first in ("define", "define-memo")
+                and isinstance(expr.second, Pair)):
+            target = expr.second.first
+            bound.add(target.first if isinstance(target, Pair) else target)
+    for expr in body:
+        _add_free_variables(expr, bound, free, calls)
+
+
+#################
+# Flat Closures #
+#################
+
+# Whether closures bind only the free variables of their bodies, rather than
+# keeping the whole environment in which they were created.
+flat_closures = True
+
+class _BodyInfo:
+    """The names bound and used by the Scheme list BODY of a lambda or let form
+    with parameters PARAMS (a Scheme list or set of symbols)."""
+
+    def __init__(self, params, body):
+        self.params = frozenset(params)
+        self.defines = {}  # How many define forms bind each name in the frame
+        self.calls = set()  # Procedures called, as given by free_variables
+        try:
+            for expr in body:
+                _count_defines(expr, self.defines)
+            self.free = frozenset(free_variables(Pair("begin", body),
+                                                 self.params, self.calls))
+        except SchemeError:  # Malformed, so left for scheme_eval to report
+            self.free, self.open = frozenset(), True
+        else:
+            # eval and load can define names in the calling frame
+            self.open = "eval" in self.free or "load" in self.free
+
+_FLAT_INFO = _BodyInfo(nil, nil)
+
+def body_info(params, body):
+    """The _BodyInfo of BODY with parameters PARAMS, computed once for each
+    lambda or let form and kept on BODY, which may be shared (as by hash
+    consing) by forms with other parameters."""
+    info = getattr(body, "_info", None)
+    if info is None or info.params != frozenset(params):
+        info = body._info = _BodyInfo(params, body)
+    return info
+
+def _count_defines(expr, counts):
+    """Add to COUNTS the names defined by EXPR in the frame that evaluates it,
+    leaving out the bodies of nested lambda, mu, and let forms."""
+    if not isinstance(expr, Pair) or not scheme_listp(expr):
+        return
+    first, rest = expr.first, expr.second
+    if first in ("quote", "lambda", "mu", "future"):
+        return
+    elif first in ("define", "define-memo") and rest is not nil:
+        target = rest.first
+        if isinstance(target, Pair):
+            target = target.first
+        else:
+            for value in rest.second:
+                _count_defines(value, counts)
+        if scheme_symbolp(target):
+            counts[target] = counts.get(target, 0) + 1
+    elif first in ("let", "do") and rest is not nil:
+        bindings = rest.first
+        if first == "let" and scheme_symbolp(bindings) and rest.second is not nil:
+            bindings = rest.second.first  # A named let
+        if scheme_listp(bindings):
+            for binding in bindings:
+                if isinstance(binding, Pair) and isinstance(binding.second, Pair):
+                    _count_defines(binding.second.first, counts)
+    else:
+        for sub in expr:
+            if isinstance(sub, Pair):
+                _count_defines(sub, counts)
+
+def flat_closure_env(info, env):
+    """Return the environment for a closure with body INFO created in ENV.
+
+    When possible, this is a frame binding only the free variables of the body
+    to their values, whose parent is the global frame.  The values are copied,
+    so this is only possible if none of the names may be bound again by a later
+    define in ENV.  It is also only possible if the body, and those of the
+    frames of ENV, only call lambda procedures and primitives that do not use
+    the frame of their caller, as mu procedures, eval, and load do.  Otherwise,
+    ENV itself is returned.
+
+    >>> env = create_global_frame()
+    >>> expr = "((lambda (big n) (lambda (x) (+ x n))) '(1 2 3) 10)"
+    >>> closure = scheme_eval(read_line(expr), env)
+    >>> closure.env
+    <{n: 10} -> <Global Frame>>
+    >>> expr = "((lambda (n) (define (f) (g)) (define (g) n) f) 1)"
+    >>> scheme_eval(read_line(expr), env).env
+    <{f: (lambda () (g)), g: (lambda () n), n: 1} -> <Global Frame>>
+    >>> expr = "((lambda (n) (define m (mu () n)) ((lambda () (m)))) 1)"
+    >>> scheme_eval(read_line(expr), env)
+    1
+    """
+    global_env = env.global_frame()
+    if not flat_closures or env is global_env or info.open:
+        return env
+    if not _calls_lexical(info, env):
+        return env
+    bindings = {}
+    for name in info.free:
+        frame = env
+        while frame is not global_env:
+            frame_info = frame.info
+            if (frame_info is None or frame_info.open or
+                    not _calls_lexical(frame_info, frame)):
+                return env
+            count = frame_info.defines.get(name, 0)
+            if name in frame.bindings:
+                if count > 1 or (count == 1 and name in frame_info.params):
+                    return env  # May be defined again
+                bindings[name] = frame.bindings[name]
+                break
+            elif count:
+                return env  # May be defined later
+            frame = frame.parent
+    flat = Frame(global_env)
+    flat.bindings = bindings
+    flat.info = _FLAT_INFO
+    return flat
+
+def _calls_lexical(info, env):
+    """Whether the procedures called by a body with INFO, looked up in ENV,
+    are all lambda procedures or primitives that do not use the frame of
+    their caller."""
+    for name in info.calls:
+        if name is None:
+            return False
+        try:
+            procedure = env.lookup(name)
+        except SchemeError:
+            return False
+        if isinstance(procedure, PrimitiveProcedure):
+            if procedure.use_env:
+                return False
+        elif not isinstance(procedure, (LambdaProcedure, MemoProcedure)):
+            return False
+    return True
+
+#########
+# Loops #
+#########
+
+# Named let and do loops whose frames cannot outlive an iteration are compiled
+# to Python functions of the loop frame, so that each iteration updates that
+# frame in place and evaluates procedure calls without going through
+# scheme_eval.
+
+def _loop_code(form, compile):
+    """The compiled code of the loop FORM, computed once by the function
+    COMPILE, which returns None if the loop must create a frame for each
+    iteration.  The code is kept on FORM."""
+    cached = getattr(form, "_loop_code", None)
+    if cached is None or cached[0] is not compile:
+        cached = form._loop_code = (compile, compile(form))
+    return cached[1]
+
+def _compile_named_let(vals):
+    """Compile the body of a named let form with parameters VALS to a list of
+    functions for all but its last expression and a function for the last."""
+    name, bindings, body = vals.first, vals[1], vals.second.second
+    params = tuple(binding.first for binding in bindings)
+    if (name in params or _may_capture(body) or
+            not _sequence_calls_only_in_tail(name, len(params), body)):
+        return None
+    exprs = [_compile(expr, params) for expr in body]
+    exprs[-1] = _compile(body[len(exprs) - 1], params, name)
+    return exprs[:-1], exprs[-1]
+
+def _compile_do(vals):
+    """Compile the test, commands and steps of a do form with parameters
+    VALS."""
+    if _may_capture(vals):
+        return None
+    specs, commands = vals.first, vals.second.second
+    params = tuple(spec.first for spec in specs)
+    return (_compile(vals[1].first, params),
+            [_compile(command, params) for command in commands],
+            [(spec.first, _compile(spec[2], params))
+             for spec in specs if len(spec) == 3])
+
+def _may_capture(expr):
+    """Whether evaluating EXPR could keep or change the frame in which it is
+    evaluated, by creating a procedure, defining a name, or using eval or load.
+
+    >>> _may_capture(read_line("(if (f x) (g 'lambda) y)"))
+    False
+    >>> _may_capture(read_line("(map (lambda (y) (+ x y)) s)"))
+    True
+    """
+    if expr in ("eval", "load"):
+        return True
+    if not isinstance(expr, Pair) or expr.first == "quote":
+        return False
+    if expr.first in ("lambda", "mu", "define", "define-memo", "future"):
+        return True
+    while isinstance(expr, Pair):
+        if _may_capture(expr.first):
+            return True
+        expr = expr.second
+    return False
+
+def _is_tail_form(first):
+    """Whether FIRST names a form through which a named let body can reach a
+    tail call."""
+    return first in ("if", "cond", "begin", "and", "or")
+
+def _calls_only_in_tail(name, arity, expr, tail):
+    """Whether the symbol NAME occurs in EXPR only as the operator of calls
+    with ARITY operands that are in tail position, where EXPR itself is in
+    tail position if TAIL is true.
+
+    >>> expr = read_line("(if (= n 0) 1 (begin (f n) (loop (- n 1))))")
+    >>> _calls_only_in_tail("loop", 1, expr, True)
+    True
+    >>> _calls_only_in_tail("loop", 1, read_line("(+ 1 (loop n))"), True)
+    False
+    """
+    if expr == name:
+        return False
+    if not isinstance(expr, Pair) or not scheme_listp(expr):
+        return True
+    first, rest = expr.first, expr.second
+    if first == "quote":
+        return True
+    if first == name:
+        return (tail and len(rest) == arity and
+                all(_calls_only_in_tail(name, arity, e, False) for e in rest))
+    if not tail or not _is_tail_form(first):
+        return all(_calls_only_in_tail(name, arity, e, False) for e in expr)
+    if first == "if":  # The predicate is not in tail position
+        return all(_calls_only_in_tail(name, arity, e, k > 0)
+                   for k, e in enumerate(rest))
+    if first == "cond":
+        return all(isinstance(clause, Pair) and scheme_listp(clause) and
+                   _calls_only_in_tail(name, arity, clause.first, False) and
+                   _sequence_calls_only_in_tail(name, arity, clause.second)
+                   for clause in rest)
+    return _sequence_calls_only_in_tail(name, arity, rest)
+
+def _sequence_calls_only_in_tail(name, arity, exprs):
+    """Whether NAME occurs in the Scheme list EXPRS only as the operator of
+    tail calls with ARITY operands, where the last of EXPRS is in tail
+    position."""
+    exprs = list(exprs)
+    return (all(_calls_only_in_tail(name, arity, e, False)
+                for e in exprs[:-1]) and
+            (not exprs or _calls_only_in_tail(name, arity, exprs[-1], True)))
+
+_REPEAT = object()  # Returned by the body of a named let that calls itself
+
+_SPECIAL_FORMS = {"lambda", "mu", "define", "define-memo", "future", "quote",
+                  "let", "do"}
+
+def _compile(expr, params, name=None):
+    """Compile EXPR to a Python function that evaluates it, as scheme_eval
+    would, in a loop frame binding the tuple of symbols PARAMS.
+
+    If NAME is given, EXPR is in tail position in the body of a named let
+    called NAME, and the function returns _REPEAT after rebinding PARAMS to
+    the operands of a call to NAME.  Special forms other than quote, if, cond,
+    begin, and, and or are left to scheme_eval.
+
+    >>> env = create_global_frame()
+    >>> frame = env.make_call_frame(read_line("(n)"), read_line("(3)"))
+    >>> _compile(read_line("(if (> n 2) (* n 2) 'small)"), ("n",))(frame)
+    6
+    >>> loop = _compile(read_line("(and (> n 0) (f (- n 1)))"), ("n",), "f")
+    >>> loop(frame) is _REPEAT, frame.bindings
+    (True, {'n': 2})
+    """
+    def evaluate(frame):
+        return scheme_eval(expr, frame)
+    if scheme_symbolp(expr):
+        if expr in params:
+            return lambda frame: frame.bindings[expr]
+        return lambda frame: frame.parent.lookup(expr)
+    elif (scheme_atomp(expr) or scheme_stringp(expr) or expr is okay or
+          scheme_vectorp(expr) or scheme_hash_tablep(expr)):
+        return lambda frame: expr
+    elif not isinstance(expr, Pair) or not scheme_listp(expr):
+        return evaluate
+    first, rest = expr.first, expr.second
+    operands = len(rest)
+
+    if name is not None and first == name:
+        args = [_compile(e, params) for e in rest]
+        def repeat(frame):
+            frame.bindings.update(zip(params, [arg(frame) for arg in args]))
+            return _REPEAT
+        return repeat
+    elif first == "quote" and operands == 1:
+        value = rest.first
+        return lambda frame: value
+    elif first == "if" and operands in (2, 3):
+        test = _compile(rest.first, params)
+        consequent = _compile(rest[1], params, name)
+        if operands == 2:
+            return lambda frame: (consequent(frame) if scheme_true(test(frame))
+                                  else okay)
+        alternative = _compile(rest[2], params, name)
+        return lambda frame: (consequent(frame) if scheme_true(test(frame))
+                              else alternative(frame))
+    elif first in ("begin", "and", "or") and (operands or first != "begin"):
+        return _compile_sequence(first, rest, params, name)
+    elif first == "cond" and _well_formed_cond(rest):
+        return _compile_cond(rest, params, name)
+    elif scheme_symbolp(first) and (first in LOGIC_FORMS or
+                                    first in _SPECIAL_FORMS):
+        return evaluate
+
+    operator = _compile(first, params)
+    args = [_compile(e, params) for e in rest]
+    def call(frame):
+        procedure = operator(frame)
+        values = [arg(frame) for arg in args]
+        if type(procedure) is PrimitiveProcedure and not procedure.use_env:
+            if _steps_left is not None:
+                take_step()
+            try:
+                return procedure.fn(*values)
+            except TypeError as e:
+                raise SchemeError("type error: {0}".format(*e.args))
+        return scheme_apply(procedure, scheme_list(*values), frame)
+    return call
+
+def _compile_sequence(form, exprs, params, name):
+    """Compile a begin, and, or or FORM of the Scheme list EXPRS."""
+    if exprs is nil:
+        value = form == "and"
+        return lambda frame: value
+    parts = [_compile(e, params) for e in exprs]
+    parts[-1] = _compile(exprs[len(parts) - 1], params, name)
+    init, last = parts[:-1], parts[-1]
+    if form == "begin":
+        def sequence(frame):
+            for part in init:
+                part(frame)
+            return last(frame)
+    else:
+        stop = scheme_false if form == "and" else scheme_true
+        def sequence(frame):
+            for part in init:
+                value = part(frame)
+                if stop(value):
+                    return value
+            return last(frame)
+    return sequence
+
+def _well_formed_cond(clauses):
+    """Whether the Scheme list CLAUSES of a cond form would be accepted by
+    do_cond_form."""
+    clauses = list(clauses)
+    for k, clause in enumerate(clauses):
+        if not isinstance(clause, Pair) or not scheme_listp(clause):
+            return False
+        if clause.first == "else" and (k < len(clauses) - 1 or
+                                       clause.second is nil):
+            return False
+    return True
+
+def _compile_cond(clauses, params, name):
+    compiled = []
+    for clause in clauses:
+        test = None if clause.first == "else" else _compile(clause.first, params)
+        body = clause.second
+        if body is nil:
+            compiled.append((test, None))
+        else:
+            compiled.append((test, _compile_sequence("begin", body, params,
+                                                     name)))
+    def cond(frame):
+        for test, body in compiled:
+            value = True if test is None else test(frame)
+            if scheme_true(value):
+                return value if body is None else body(frame)
+        return okay
+    return cond
+
+
+###########
+# Futures #
+###########
+
+class Future:
+    """The eventual value of an expression evaluated by another process, to be
+    used in the global frame ENV."""
+
+    def __init__(self, future, env):
+        self.future = future
+        self.env = env
+
+    def __str__(self):
+        return "#[future]"
+
+def _export(value, exported):
+    """Return a copy of VALUE that can be sent to another process, where it
+    will be used with that process's own global frame.  Closures are copied
+    with a frame binding only the free variables of their bodies, whose values
+    are exported in turn.  EXPORTED maps the ids of exported procedures to
+    their copies and collects the copied frames."""
+    if isinstance(value, LambdaProcedure):
+        if id(value) not in exported:
+            frame = Frame(None)
+            copy = LambdaProcedure(value.formals, value.body, frame)
+            copy.info = value.info
+            exported[id(value)] = copy
+            exported.setdefault("frames", []).append(frame)
+            names = free_variables(value.body, set(value.formals))
+            _export_bindings(names, value.env, frame, exported)
+        return exported[id(value)]
+    elif isinstance(value, MemoProcedure):
+        return MemoProcedure(_export(value.procedure, exported), value.max_size)
+    elif isinstance(value, Pair):
+        items, rest = [], value
+        while isinstance(rest, Pair):
+            items.append(_export(rest.first, exported))
+            rest = rest.second
+        rest = _export(rest, exported)
+        for item in reversed(items):
+            rest = Pair(item, rest)
+        return rest
+    elif isinstance(value, (OutputPort, InputPort, Future)):
+        raise SchemeError("cannot send {0} to another process".format(value))
+    return value
+
+def _export_bindings(names, env, frame, exported):
+    """Bind each of NAMES that is defined in ENV to its exported value in FRAME,
+    omitting primitives, which every process defines."""
+    for name in names:
+        try:
+            value = env.lookup(name)
+        except SchemeError:
+            continue  # Reported as an unknown identifier when evaluated
+        if not isinstance(value, PrimitiveProcedure):
+            frame.define(name, _export(value, exported))
+
+def _import_frames(exported, env):
+    """Attach the frames copied by _export to the global frame ENV."""
+    for frame in exported.get("frames", ()):
+        frame.parent = env
+
+_future_env = None
+
+def _future_global_frame():
+    """The frozen global frame in which a worker process evaluates futures."""
+    global _future_env
+    if _future_env is None:
+        _future_env = FrozenFrame(create_global_frame())
+    return _future_env
+
+def _evaluate_future(expr, env, exported):
+    """Evaluate EXPR in the exported frame ENV, in a worker process.  Returns
+    the exported value and the frames it uses."""
+    _import_frames(exported, _future_global_frame())
+    env.parent = _future_global_frame()
+    result = {}
+    return _export(scheme_eval(expr, env), result), result
+
+def _map_future(procedure, items, exported):
+    """Apply the exported PROCEDURE to each of ITEMS, in a worker process."""
+    _import_frames(exported, _future_global_frame())
+    env = Frame(_future_global_frame())
+    result = {}
+    values = [_export(scheme_apply(procedure, Pair(item, nil), env), result)
+              for item in items]
+    return values, result
+
+_pool = None
+
+def future_pool():
+    """The process pool that evaluates futures, started on first use."""
+    global _pool
+    if _pool is None:
+        import concurrent.futures
+        _pool = concurrent.futures.ProcessPoolExecutor()
+    return _pool
+
+def do_future_form(vals, env):
+    """Evaluate a future form with parameters VALS in environment ENV, which
+    starts evaluating its expression in a worker process.  The expression
+    should have no side effects; it is evaluated with copies of the values of
+    its free variables."""
+    check_form(vals, 1, 1)
+    expr = vals[0]
+    exported = {}
+    frame = Frame(None)
+    _export_bindings(free_variables(expr), env, frame, exported)
+    future = future_pool().submit(_evaluate_future, expr, frame, exported)
+    return Future(future, env.global_frame())
+
+def scheme_touch(value):
+    """Wait for and return the value of a future, or VALUE if it is not one."""
+    if not isinstance(value, Future):
+        return value
+    try:
+        result, exported = value.future.result()
+    except SchemeError:
+        raise
+    except Exception as exc:
+        raise SchemeError("future failed: {0}".format(exc))
+    _import_frames(exported, value.env)
+    return result
+
+def scheme_pmap(procedure, lst, env):
+    """Map PROCEDURE over the Scheme list LST in parallel worker processes."""
+    check_type(lst, scheme_listp, 1, "pmap")
+    items = list(lst)
+    exported = {}
+    procedure = _export(procedure, exported)
+    size = max(1, -(-len(items) // (4 * (os.cpu_count() or 1))))
+    pieces = [future_pool().submit(_map_future, procedure, items[i:i+size],
+                                   exported)
+              for i in range(0, len(items), size)]
+    results = []
+    for piece in pieces:
+        results.extend(scheme_touch(Future(piece, env.global_frame())))
+    return scheme_list(*results)
+
+
 ################
 # Input/Output #
 ################
@@ -518,13 +1550,51 @@ def scheme_load(*args):
         sym = eval(sym)
     check_type(sym, scheme_symbolp, 0, "load")
     with scheme_open(sym) as infile:
-        lines = infile.readlines()
-    args = (lines, None) if quiet else (lines,)
-    def next_line():
-        return buffer_lines(*args)
-    read_eval_print_loop(next_line, env.global_frame(), quiet=quiet)
+        args = (infile, None) if quiet else (infile,)
+        def next_line():
+            return buffer_lines(*args)
+        read_eval_print_loop(next_line, env.global_frame(), quiet=quiet)
     return okay
 
+class _SortKey:
+    """Orders Scheme values by calling the Scheme procedure LESS in ENV."""
+
+    def __init__(self, val, less, env):
+        self.val = val
+        self.less = less
+        self.env = env
+
+    def __lt__(self, other):
+        args = Pair(self.val, Pair(other.val, nil))
+        return scheme_true(scheme_apply(self.less, args, self.env))
+
+@primitive("sort", use_env=True)
+def scheme_sort(seq, less, env):
+    """Return a sorted copy of SEQ, a Scheme list or vector, ordered by the
+    Scheme procedure LESS.  The sort is stable.
+
+    >>> env = create_global_frame()
+    >>> scheme_sort(read_line("(3 1 2)"), env.lookup("<"), env)
+    Pair(1, Pair(2, Pair(3, nil)))
+    """
+    if scheme_vectorp(seq):
+        return Vector(k.val for k in
+                      sorted(_SortKey(val, less, env) for val in seq))
+    check_type(seq, scheme_listp, 0, "sort")
+    keys = sorted(_SortKey(val, less, env) for val in seq)
+    return scheme_list(*(k.val for k in keys))
+
+def scheme_with_output_to_string(thunk, env):
+    """Apply THUNK to no arguments, returning everything that it writes to the
+    current output port as a Scheme string."""
+    port = scheme_ports.StringOutputPort()
+    old = scheme_ports.set_current_output_port(port)
+    try:
+        scheme_apply(thunk, nil, env)
+    finally:
+        scheme_ports.set_current_output_port(old)
+    return scheme_string(port.getvalue())
+
 def scheme_open(filename):
     """If either FILENAME or FILENAME.scm is the name of a valid file,
     return a Python file opened to it. Otherwise, raise an error."""
@@ -544,6 +1614,12 @@ def create_global_frame():
     env.define("eval", PrimitiveProcedure(scheme_eval, True))
     env.define("apply", PrimitiveProcedure(scheme_apply, True))
     env.define("load", PrimitiveProcedure(scheme_load, True))
+    env.define("with-output-to-string",
+               PrimitiveProcedure(scheme_with_output_to_string, True))
+    env.define("touch", PrimitiveProcedure(scheme_touch))
+    env.define("pmap", PrimitiveProcedure(scheme_pmap, True))
+    env.define("memoize", PrimitiveProcedure(scheme_memoize))
+    env.define("memo-stats", PrimitiveProcedure(scheme_memo_stats))
     add_primitives(env)
     return env
 
@@ -559,9 +1635,8 @@ def run(*argv):
                 load_files = argv[1:]
             else:
                 input_file = open(argv[0])
-                lines = input_file.readlines()
                 def next_line():
-                    return buffer_lines(lines)
+                    return buffer_lines(input_file)
                 interactive = False
         except IOError as err:
             print(err)
@@ -0,0 +1,277 @@
+"""This module implements Scheme ports, the sources and destinations of text
+read and written by Scheme programs.
+
+The current output port starts as the console, which writes to whatever
+sys.stdout is at the time of writing.  File ports buffer their output and
+write it to the file in large chunks; any buffered output is flushed when the
+port is closed or the interpreter exits.
+
+Input ports read their file in blocks, so that a program can stream through a
+file much larger than memory one line, character, or datum at a time.  Since
+Scheme strings are represented by their quoted text, characters read from a
+port are represented as Scheme strings of length one.
+"""
+
+import atexit
+import sys
+from abc import ABC, abstractmethod
+from buffer import Buffer
+from scheme_reader import scheme_read
+from scheme_tokens import tokenize_line, next_candidate_token
+
+BUFFER_SIZE = 1 << 16  # Characters buffered by a file port before writing
+
+class OutputPort(ABC):
+    """A destination for text written by a Scheme program.  Subclasses
+    implement write.
+
+    >>> port = StringOutputPort()
+    >>> port.write("hello")
+    >>> port.write(" world")
+    >>> port.getvalue()
+    'hello world'
+    """
+
+    name = "output"
+
+    @abstractmethod
+    def write(self, text):
+        """Write the Python string TEXT to the port."""
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __str__(self):
+        return "#[output-port {0}]".format(self.name)
+
+class ConsolePort(OutputPort):
+    """Writes to sys.stdout, looked up on each write so that redirecting
+    sys.stdout (as scheme_test does) also redirects the console."""
+
+    name = "console"
+
+    def write(self, text):
+        sys.stdout.write(text)
+
+    def flush(self):
+        sys.stdout.flush()
+
+class StringOutputPort(OutputPort):
+    """Accumulates written text in memory."""
+
+    name = "string"
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def getvalue(self):
+        """All text written so far."""
+        value = "".join(self.parts)
+        self.parts = [value]
+        return value
+
+_open_file_ports = set()  # Kept open until closed or the interpreter exits
+
+class FileOutputPort(OutputPort):
+    """Writes to a file, buffering up to BUFFER_SIZE characters at a time.
+
+    >>> import io
+    >>> f = io.StringIO()
+    >>> port = FileOutputPort(f, buffer_size=4)
+    >>> port.write("ab")
+    >>> f.getvalue()
+    ''
+    >>> port.write("cde")
+    >>> f.getvalue()
+    'abcde'
+    """
+
+    def __init__(self, file, name=None, buffer_size=BUFFER_SIZE):
+        self.file = file
+        self.name = name or getattr(file, "name", "file")
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+        _open_file_ports.add(self)
+
+    def write(self, text):
+        if self.file is None:
+            raise ValueError("write to closed port")
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.file.write("".join(self.parts))
+            self.parts, self.size = [], 0
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+            _open_file_ports.discard(self)
+
+@atexit.register
+def _close_file_ports():
+    """Write out the buffers of ports that a program did not close."""
+    for port in list(_open_file_ports):
+        port.close()
+
+console = ConsolePort()
+_current_output = console
+
+def current_output_port():
+    """The port to which display, print and newline write by default."""
+    return _current_output
+
+def set_current_output_port(port):
+    """Make PORT the current output port, returning the previous one."""
+    global _current_output
+    old, _current_output = _current_output, port
+    return old
+
+
+###############
+# Input ports #
+###############
+
+class eof:
+    """The end-of-file object, returned by reads past the end of a port."""
+    def __repr__(self):
+        return "eof"
+
+    def __str__(self):
+        return "#[eof]"
+
+    def __reduce__(self):
+        return "eof"
+
+eof = eof() # Assignment hides the eof class; there is only one instance
+
+class InputPort:
+    """A source of text for a Scheme program, read from FILE in blocks of
+    BUFFER_SIZE characters.
+
+    >>> import io
+    >>> port = InputPort(io.StringIO("(1 2) x\\nline two\\n"), buffer_size=4)
+    >>> port.read_datum()
+    Pair(1, Pair(2, nil))
+    >>> port.read_char()
+    ' '
+    >>> port.read_datum()
+    'x'
+    >>> port.read_line()
+    ''
+    >>> port.peek_char()
+    'l'
+    >>> port.read_line()
+    'line two'
+    >>> port.read_line() is eof
+    True
+    """
+
+    def __init__(self, file, name=None, buffer_size=BUFFER_SIZE):
+        self.file = file
+        self.name = name or getattr(file, "name", "file")
+        self.buffer_size = buffer_size
+        self.text = ""
+        self.pos = 0
+
+    def _fill(self):
+        """Replace the buffer, which must have been read to its end, with the
+        next block.  Returns whether more text was available."""
+        if self.file is None:
+            raise ValueError("read from closed port")
+        self.text, self.pos = self.file.read(self.buffer_size), 0
+        return self.text != ""
+
+    def peek_char(self):
+        """The next character, or eof, without consuming it."""
+        if self.pos >= len(self.text) and not self._fill():
+            return eof
+        return self.text[self.pos]
+
+    def read_char(self):
+        """Consume and return the next character, or eof."""
+        c = self.peek_char()
+        if c is not eof:
+            self.pos += 1
+        return c
+
+    def _read_line(self):
+        """Consume and return the next line, including its newline, or ''
+        at the end of the file.  A line that spans several blocks is joined
+        once, so reading it takes time linear in its length."""
+        end = self.text.find("\n", self.pos)
+        if end >= 0:
+            line, self.pos = self.text[self.pos:end+1], end+1
+            return line
+        parts = [self.text[self.pos:]]
+        while self._fill():
+            end = self.text.find("\n")
+            if end >= 0:
+                parts.append(self.text[:end+1])
+                self.pos = end + 1
+                break
+            parts.append(self.text)
+        else:
+            self.pos = len(self.text)
+        return "".join(parts)
+
+    def read_line(self):
+        """Consume and return the next line without its newline, or eof."""
+        line = self._read_line()
+        if line == "":
+            return eof
+        return line[:-1] if line.endswith("\n") else line
+
+    def read_datum(self):
+        """Consume and return the next Scheme expression, or eof.  Text after
+        the expression on its last line is left unread."""
+        lines = []
+        def source():
+            while True:
+                line = self._read_line()
+                if line == "":
+                    return
+                lines.append(line)
+                yield tokenize_line(line)
+        src = Buffer(source())
+        try:
+            datum = scheme_read(src)
+        except EOFError:
+            return eof
+        # Push back the unread text of the last line
+        line, k = lines[-1], 0
+        for _ in range(src.index):
+            _, k = next_candidate_token(line, k)
+        self.text = line[k:] + self.text[self.pos:]
+        self.pos = 0
+        return datum
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __str__(self):
+        return "#[input-port {0}]".format(self.name)
+
+_current_input = None
+
+def current_input_port():
+    """The port from which read, read-line and read-char read by default,
+    initially standard input."""
+    global _current_input
+    if _current_input is None:
+        _current_input = InputPort(sys.stdin, "console")
+    return _current_input
@@ -2,13 +2,12 @@
 
 import math
 import operator
+import os
 import sys
-from scheme_reader import Pair, nil
-
-try:
-    import turtle
-except:
-    print("warning: could not import the turtle module.", file=sys.stderr)
+from scheme_ports import (OutputPort, FileOutputPort, InputPort, eof,
+                          current_output_port, current_input_port)
+from scheme_reader import (Pair, nil, Vector, HashTable, set_hash_consing,
+                           str_parts)
 
 class SchemeError(Exception):
     """Exception indicating an error in a Scheme program."""
@@ -18,6 +17,9 @@ class okay:
     def __repr__(self):
         return "okay"
 
+    def __reduce__(self):
+        return "okay"
+
 okay = okay() # Assignment hides the okay class; there is only one instance
 
 ########################
@@ -36,10 +38,11 @@ class PrimitiveProcedure:
 
 _PRIMITIVES = []
 
-def primitive(*names):
-    """An annotation to convert a Python function into a PrimitiveProcedure."""
+def primitive(*names, use_env=False):
+    """An annotation to convert a Python function into a PrimitiveProcedure.
+    If USE_ENV, the function is also passed the calling environment."""
     def add(fn):
-        proc = PrimitiveProcedure(fn)
+        proc = PrimitiveProcedure(fn, use_env)
         for name in names:
             _PRIMITIVES.append((name,proc))
         return fn
@@ -142,6 +145,182 @@ def scheme_append(*vals):
             result = r
     return result
 
+@primitive("reverse")
+def scheme_reverse(lst):
+    check_type(lst, scheme_listp, 0, "reverse")
+    result = nil
+    while lst is not nil:
+        result = Pair(lst.first, result)
+        lst = lst.second
+    return result
+
+@primitive("list-tail")
+def scheme_list_tail(lst, k):
+    check_type(k, scheme_integerp, 1, "list-tail")
+    for _ in range(int(k)):
+        if not scheme_pairp(lst):
+            raise SchemeError("list-tail: list has fewer than {0} elements"
+                              .format(k))
+        lst = lst.second
+    return lst
+
+@primitive("list-copy")
+def scheme_list_copy(lst):
+    if not scheme_pairp(lst):
+        return lst
+    r = p = Pair(lst.first, nil)
+    lst = lst.second
+    while scheme_pairp(lst):
+        p.second = Pair(lst.first, nil)
+        p = p.second
+        lst = lst.second
+    p.second = lst
+    return r
+
+def _member(x, lst, same, name):
+    """The first sublist of LST whose first element is SAME as X, or False."""
+    check_type(lst, scheme_listp, 1, name)
+    while lst is not nil:
+        if same(x, lst.first):
+            return lst
+        lst = lst.second
+    return False
+
+def _assoc(key, alist, same, name):
+    """The first pair in association list ALIST whose first element is SAME
+    as KEY, or False."""
+    check_type(alist, scheme_listp, 1, name)
+    while alist is not nil:
+        entry = alist.first
+        check_type(entry, scheme_pairp, 1, name)
+        if same(key, entry.first):
+            return entry
+        alist = alist.second
+    return False
+
+@primitive("member")
+def scheme_member(x, lst):
+    return _member(x, lst, operator.eq, "member")
+
+@primitive("memq")
+def scheme_memq(x, lst):
+    return _member(x, lst, scheme_eqp, "memq")
+
+@primitive("assoc")
+def scheme_assoc(key, alist):
+    return _assoc(key, alist, operator.eq, "assoc")
+
+@primitive("assq")
+def scheme_assq(key, alist):
+    return _assoc(key, alist, scheme_eqp, "assq")
+
+##
+## Vectors and hash tables
+##
+
+@primitive("vector?")
+def scheme_vectorp(x):
+    return isinstance(x, Vector)
+
+def _check_index(v, k, name):
+    """Return K as an int, checking that it is a valid index into vector V."""
+    check_type(k, scheme_integerp, 1, name)
+    if not 0 <= k < len(v):
+        raise SchemeError("{0}: index {1} out of range".format(name, k))
+    return int(k)
+
+@primitive("make-vector")
+def scheme_make_vector(k, fill=0):
+    check_type(k, scheme_integerp, 0, "make-vector")
+    if k < 0:
+        raise SchemeError("make-vector: negative length {0}".format(k))
+    return Vector([fill] * int(k))
+
+@primitive("vector")
+def scheme_vector(*vals):
+    return Vector(vals)
+
+@primitive("vector-length")
+def scheme_vector_length(v):
+    check_type(v, scheme_vectorp, 0, "vector-length")
+    return len(v)
+
+@primitive("vector-ref")
+def scheme_vector_ref(v, k):
+    check_type(v, scheme_vectorp, 0, "vector-ref")
+    return v[_check_index(v, k, "vector-ref")]
+
+@primitive("vector-set!")
+def scheme_vector_set(v, k, val):
+    check_type(v, scheme_vectorp, 0, "vector-set!")
+    v[_check_index(v, k, "vector-set!")] = val
+    return okay
+
+@primitive("vector-fill!")
+def scheme_vector_fill(v, val):
+    check_type(v, scheme_vectorp, 0, "vector-fill!")
+    v[:] = [val] * len(v)
+    return okay
+
+@primitive("vector->list")
+def scheme_vector_to_list(v):
+    check_type(v, scheme_vectorp, 0, "vector->list")
+    return scheme_list(*v)
+
+@primitive("list->vector")
+def scheme_list_to_vector(lst):
+    check_type(lst, scheme_listp, 0, "list->vector")
+    return Vector(lst)
+
+@primitive("hash-table?")
+def scheme_hash_tablep(x):
+    return isinstance(x, HashTable)
+
+@primitive("make-hash-table")
+def scheme_make_hash_table():
+    return HashTable()
+
+@primitive("hash-ref")
+def scheme_hash_ref(table, key, *default):
+    check_type(table, scheme_hash_tablep, 0, "hash-ref")
+    if key in table:
+        return table[key]
+    elif default:
+        return default[0]
+    raise SchemeError("hash-ref: no value for key {0}".format(key))
+
+@primitive("hash-set!")
+def scheme_hash_set(table, key, val):
+    check_type(table, scheme_hash_tablep, 0, "hash-set!")
+    table[key] = val
+    return okay
+
+@primitive("hash-remove!")
+def scheme_hash_remove(table, key):
+    check_type(table, scheme_hash_tablep, 0, "hash-remove!")
+    table.pop(key, None)
+    return okay
+
+@primitive("hash-has-key?")
+def scheme_hash_has_keyp(table, key):
+    check_type(table, scheme_hash_tablep, 0, "hash-has-key?")
+    return key in table
+
+@primitive("hash-count")
+def scheme_hash_count(table):
+    check_type(table, scheme_hash_tablep, 0, "hash-count")
+    return len(table)
+
+@primitive("hash-keys")
+def scheme_hash_keys(table):
+    check_type(table, scheme_hash_tablep, 0, "hash-keys")
+    return scheme_list(*table.keys())
+
+@primitive("hash-values")
+def scheme_hash_values(table):
+    check_type(table, scheme_hash_tablep, 0, "hash-values")
+    return scheme_list(*table.values())
+
 @primitive("string?")
 def scheme_stringp(x):
     return isinstance(x, str) and x.startswith('"')
@@ -195,21 +374,21 @@ def scheme_div(val0, val1):
     try:
         return _arith(operator.truediv, val0, [val1])
     except ZeroDivisionError as err:
-        raise SchemeError(err)
+        raise SchemeError(str(err))
 
 @primitive("quotient")
 def scheme_quo(val0, val1):
     try:
         return _arith(operator.floordiv, val0, [val1])
     except ZeroDivisionError as err:
-        raise SchemeError(err)
+        raise SchemeError(str(err))
 
 @primitive("modulo", "remainder")
 def scheme_modulo(val0, val1):
     try:
         return _arith(operator.mod, val0, [val1])
     except ZeroDivisionError as err:
-        raise SchemeError(err)
+        raise SchemeError(str(err))
 
 @primitive("floor")
 def scheme_floor(val):
@@ -276,29 +455,188 @@ def scheme_atomp(x):
         return True
     return False
 
+def _output_port(port, name):
+    """PORT, defaulting to the current output port, checked to be open."""
+    if port is None:
+        return current_output_port()
+    check_type(port, scheme_output_portp, 1, name)
+    if getattr(port, "file", True) is None:
+        raise SchemeError("{0}: port is closed".format(name))
+    return port
+
+def _write_value(val, port):
+    """Write the printed form of VAL to PORT, streaming long lists in chunks."""
+    if not isinstance(val, Pair):
+        port.write(str(val))
+        return
+    chunk = []
+    for part in str_parts(val):
+        chunk.append(part)
+        if len(chunk) >= 4096:
+            port.write("".join(chunk))
+            chunk = []
+    port.write("".join(chunk))
+
 @primitive("display")
-def scheme_display(val):
+def scheme_display(val, port=None):
+    port = _output_port(port, "display")
     if scheme_stringp(val):
-        val = eval(val)
-    print(str(val), end="")
+        port.write(eval(val))
+    else:
+        _write_value(val, port)
     return okay
 
 @primitive("print")
-def scheme_print(val):
-    print(str(val))
+def scheme_print(val, port=None):
+    port = _output_port(port, "print")
+    _write_value(val, port)
+    port.write("\n")
     return okay
 
 @primitive("newline")
-def scheme_newline():
-    print()
-    sys.stdout.flush()
+def scheme_newline(port=None):
+    _output_port(port, "newline").write("\n")
+    return okay
+
+def scheme_string(text):
+    """The Scheme string whose characters are TEXT.
+
+    >>> print(scheme_string('say "hi"'))
+    "say \\"hi\\""
+    >>> eval(scheme_string('say "hi"'))
+    'say "hi"'
+    """
+    import json
+    return json.dumps(text, ensure_ascii=False)
+
+@primitive("output-port?")
+def scheme_output_portp(x):
+    return isinstance(x, OutputPort)
+
+@primitive("current-output-port")
+def scheme_current_output_port():
+    return current_output_port()
+
+@primitive("open-output-file")
+def scheme_open_output_file(filename):
+    check_type(filename, scheme_stringp, 0, "open-output-file")
+    filename = eval(filename)
+    try:
+        return FileOutputPort(open(filename, "w"), filename)
+    except IOError as exc:
+        raise SchemeError(str(exc))
+
+@primitive("close-port", "close-input-port", "close-output-port")
+def scheme_close_port(port):
+    check_type(port, lambda p: scheme_input_portp(p) or scheme_output_portp(p),
+               0, "close-port")
+    port.close()
+    return okay
+
+@primitive("flush-output")
+def scheme_flush_output(port=None):
+    _output_port(port, "flush-output").flush()
+    return okay
+
+@primitive("delete-file")
+def scheme_delete_file(filename):
+    check_type(filename, scheme_stringp, 0, "delete-file")
+    try:
+        os.remove(eval(filename))
+    except OSError as exc:
+        raise SchemeError(str(exc))
     return okay
 
+def _input_port(port, name):
+    """PORT, defaulting to the current input port, checked to be open."""
+    if port is None:
+        return current_input_port()
+    check_type(port, scheme_input_portp, 0, name)
+    if port.file is None:
+        raise SchemeError("{0}: port is closed".format(name))
+    return port
+
+def _char_or_eof(c):
+    return c if c is eof else scheme_string(c)
+
+@primitive("input-port?")
+def scheme_input_portp(x):
+    return isinstance(x, InputPort)
+
+@primitive("current-input-port")
+def scheme_current_input_port():
+    return current_input_port()
+
+@primitive("open-input-file")
+def scheme_open_input_file(filename):
+    check_type(filename, scheme_stringp, 0, "open-input-file")
+    filename = eval(filename)
+    try:
+        return InputPort(open(filename), filename)
+    except IOError as exc:
+        raise SchemeError(str(exc))
+
+@primitive("read")
+def scheme_read_datum(port=None):
+    return _input_port(port, "read").read_datum()
+
+@primitive("read-line")
+def scheme_read_line(port=None):
+    line = _input_port(port, "read-line").read_line()
+    return line if line is eof else scheme_string(line)
+
+@primitive("read-char")
+def scheme_read_char(port=None):
+    return _char_or_eof(_input_port(port, "read-char").read_char())
+
+@primitive("peek-char")
+def scheme_peek_char(port=None):
+    return _char_or_eof(_input_port(port, "peek-char").peek_char())
+
+@primitive("eof-object?")
+def scheme_eof_objectp(x):
+    return x is eof
+
+@primitive("eof-object")
+def scheme_eof_object():
+    return eof
+
+@primitive("serialize")
+def scheme_serialize(val, filename):
+    """Write VAL to the file FILENAME in the binary format of scheme_serialize,
+    which keeps shared structure and is much faster to read than text."""
+    from scheme_serialize import serialize
+    check_type(filename, scheme_stringp, 1, "serialize")
+    try:
+        with open(eval(filename), "wb") as f:
+            f.write(serialize(val))
+    except IOError as exc:
+        raise SchemeError(str(exc))
+    return okay
+
+@primitive("deserialize")
+def scheme_deserialize(filename):
+    """Read a value written by serialize from the file FILENAME."""
+    from scheme_serialize import deserialize
+    check_type(filename, scheme_stringp, 0, "deserialize")
+    try:
+        with open(eval(filename), "rb") as f:
+            return deserialize(f.read())
+    except IOError as exc:
+        raise SchemeError(str(exc))
+
 @primitive("error")
 def scheme_error(msg = None):
     msg = "" if msg is None else str(msg)
     raise SchemeError(msg)
 
+@primitive("set-hash-consing!")
+def scheme_set_hash_consing(enabled):
+    """Share structurally equal lists in all data read from now on, such as
+    quoted constants in files loaded afterward, if ENABLED is true."""
+    set_hash_consing(scheme_true(enabled))
+    return okay
+
 @primitive("exit")
 def scheme_exit():
     raise EOFError
@@ -307,24 +645,20 @@ def scheme_exit():
 ## Turtle graphics (non-standard)
 ##
 
-_turtle_screen_on = False
-
 def turtle_screen_on():
-    return _turtle_screen_on
+    turtle = sys.modules.get("scheme_turtle")  # Not imported until first use
+    return turtle is not None and turtle.active()
 
-def _tscheme_prep():
-    global _turtle_screen_on
-    if not _turtle_screen_on:
-        _turtle_screen_on = True
-        turtle.title("Scheme Turtles")
-        turtle.mode('logo')
+def _turtle():
+    """The turtle drawn by the turtle primitives (see scheme_turtle)."""
+    import scheme_turtle
+    return scheme_turtle.backend()
 
 @primitive("forward", "fd")
 def tscheme_forward(n):
     """Move the turtle forward a distance N units on the current heading."""
     _check_nums(n)
-    _tscheme_prep()
-    turtle.forward(n)
+    _turtle().forward(n)
     return okay
 
 @primitive("backward", "back", "bk")
@@ -332,24 +666,21 @@ def tscheme_backward(n):
     """Move the turtle backward a distance N units on the current heading,
     without changing direction."""
     _check_nums(n)
-    _tscheme_prep()
-    turtle.backward(n)
+    _turtle().backward(n)
     return okay
 
 @primitive("left", "lt")
 def tscheme_left(n):
     """Rotate the turtle's heading N degrees counterclockwise."""
     _check_nums(n)
-    _tscheme_prep()
-    turtle.left(n)
+    _turtle().left(n)
     return okay
 
 @primitive("right", "rt")
 def tscheme_right(n):
     """Rotate the turtle's heading N degrees clockwise."""
     _check_nums(n)
-    _tscheme_prep()
-    turtle.right(n)
+    _turtle().right(n)
     return okay
 
 @primitive("circle")
@@ -363,100 +694,101 @@ def tscheme_circle(r, extent = None):
         _check_nums(r)
     else:
         _check_nums(r, extent)
-    _tscheme_prep()
-    turtle.circle(r, extent and extent)
+    _turtle().circle(r, extent)
     return okay
 
 @primitive("setposition", "setpos", "goto")
 def tscheme_setposition(x, y):
     """Set turtle's position to (X,Y), heading unchanged."""
     _check_nums(x, y)
-    _tscheme_prep()
-    turtle.setposition(x, y)
+    _turtle().setposition(x, y)
     return okay
 
 @primitive("setheading", "seth")
 def tscheme_setheading(h):
     """Set the turtle's heading H degrees clockwise from north (up)."""
     _check_nums(h)
-    _tscheme_prep()
-    turtle.setheading(h)
+    _turtle().setheading(h)
     return okay
 
 @primitive("penup", "pu")
 def tscheme_penup():
     """Raise the pen, so that the turtle does not draw."""
-    _tscheme_prep()
-    turtle.penup()
+    _turtle().penup()
     return okay
 
 @primitive("pendown", "pd")
 def tscheme_pendown():
     """Lower the pen, so that the turtle starts drawing."""
-    _tscheme_prep()
-    turtle.pendown()
+    _turtle().pendown()
     return okay
 
 @primitive("showturtle", "st")
 def tscheme_showturtle():
     """Make turtle visible."""
-    _tscheme_prep()
-    turtle.showturtle()
+    _turtle().showturtle()
     return okay
 
 @primitive("hideturtle", "ht")
 def tscheme_hideturtle():
     """Make turtle visible."""
-    _tscheme_prep()
-    turtle.hideturtle()
+    _turtle().hideturtle()
     return okay
 
 @primitive("clear")
 def tscheme_clear():
     """Clear the drawing, leaving the turtle unchanged."""
-    _tscheme_prep()
-    turtle.clear()
+    _turtle().clear()
     return okay
 
 @primitive("color")
 def tscheme_color(c):
     """Set the color to C, a string such as '"red"' or '"#ffc0c0"' (representing
     hexadecimal red, green, and blue values."""
-    _tscheme_prep()
     check_type(c, scheme_stringp, 0, "color")
-    turtle.color(eval(c))
+    try:
+        _turtle().color(eval(c))
+    except ValueError as err:
+        raise SchemeError(str(err))
     return okay
 
 @primitive("begin_fill")
 def tscheme_begin_fill():
     """Start a sequence of moves that outline a shape to be filled."""
-    _tscheme_prep()
-    turtle.begin_fill()
+    _turtle().begin_fill()
     return okay
 
 @primitive("end_fill")
 def tscheme_end_fill():
     """Fill in shape drawn since last begin_fill."""
-    _tscheme_prep()
-    turtle.end_fill()
+    _turtle().end_fill()
     return okay
 
 @primitive("exitonclick")
 def tscheme_exitonclick():
-    """Wait for a click on the turtle window, and then close it."""
-    global _turtle_screen_on
-    if _turtle_screen_on:
-        print("Close or click on turtle window to complete exit")
-        turtle.exitonclick()
-        _turtle_screen_on = False
+    """Wait for a click on the turtle window, and then close it.  A headless
+    turtle writes its drawing to its output file instead."""
+    if turtle_screen_on():
+        import scheme_turtle
+        scheme_turtle.finish()
     return okay
 
 @primitive("speed")
 def tscheme_speed(s):
     """Set the turtle's animation speed as indicated by S (an integer in
-    0-10, with 0 indicating no animation (lines draw instantly), and 1-10
-    indicating faster and faster movement."""
+    0-10, with 0 indicating that the window is updated in large batches
+    (lines draw instantly), and 1-10 that it is updated after every move."""
     check_type(s, scheme_integerp, 0, "speed")
-    _tscheme_prep()
-    turtle.speed(s)
+    _turtle().set_speed(s)
+    return okay
+
+@primitive("save-drawing")
+def tscheme_save_drawing(filename):
+    """Render the turtle's drawing to FILENAME, a string ending in .svg, .ps
+    or .eps."""
+    check_type(filename, scheme_stringp, 0, "save-drawing")
+    try:
+        _turtle().save(eval(filename))
+    except (ValueError, OSError) as err:
+        raise SchemeError(str(err))
     return okay
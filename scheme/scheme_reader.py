@@ -5,6 +5,8 @@ In addition to the types defined in this file, some data types in Scheme are
 represented by their corresponding type in Python:
     number:       int or float
     symbol:       string
+    vector:       Vector (a list)
+    hash table:   HashTable (a dict)
     boolean:      bool
     unspecified:  None
 
@@ -15,6 +17,7 @@ The __str__ method of a Scheme value will return a Scheme expression that
 would be read to the value, where possible.
 """
 
+import weakref
 from ucb import main, trace, interact
 from scheme_tokens import tokenize_lines, DELIMITERS
 from buffer import Buffer, InputReader, LineReader
@@ -46,14 +49,7 @@ class Pair:
         return "Pair({0}, {1})".format(repr(self.first), repr(self.second))
 
     def __str__(self):
-        s = "(" + str(self.first)
-        second = self.second
-        while isinstance(second, Pair):
-            s += " " + str(second.first)
-            second = second.second
-        if second is not nil:
-            s += " . " + str(second)
-        return s + ")"
+        return "".join(str_parts(self))
 
     def __len__(self):
         n, second = 1, self.second
@@ -76,10 +72,41 @@ class Pair:
             y = y.second
         return y.first
 
+    def __iter__(self):
+        y = self
+        while isinstance(y, Pair):
+            yield y.first
+            y = y.second
+        if y is not nil:
+            raise TypeError("ill-formed list")
+
     def __eq__(self, p):
-        if not isinstance(p, Pair):
-            return False
-        return self.first == p.first and self.second == p.second
+        x = self
+        while isinstance(x, Pair):
+            if x is p:  # Shared structure, as from hash consing
+                return True
+            if not isinstance(p, Pair) or not x.first == p.first:
+                return False
+            x, p = x.second, p.second
+        return x == p
+
+    def __reduce__(self):
+        """Pickle the elements of a list together, rather than as a chain of
+        nested pairs, so that long lists can be sent between processes."""
+        items, rest = [], self
+        while isinstance(rest, Pair):
+            items.append(rest.first)
+            rest = rest.second
+        return (_unpickle_list, (items, rest))
+
+    def __hash__(self):
+        """Structural hash, consistent with __eq__ (equal?), so that lists can
+        be used as keys in hash tables."""
+        h, y = 0, self
+        while isinstance(y, Pair):
+            h = hash((h, y.first))
+            y = y.second
+        return hash((h, y))
 
     def map(self, fn):
         """Return a Scheme list after mapping Python function FN to SELF."""
@@ -109,8 +136,142 @@ class nil:
     def map(self, fn):
         return self
 
+    def __reduce__(self):
+        return "nil"
+
 nil = nil() # Assignment hides the nil class; there is only one instance
 
+def _unpickle_list(items, rest):
+    """The list of ITEMS ending in REST, which is nil for a proper list.
+
+    >>> import pickle
+    >>> s = read_line("(1 (2 . 3) 4)")
+    >>> pickle.loads(pickle.dumps(s))
+    Pair(1, Pair(Pair(2, 3), Pair(4, nil)))
+    >>> pickle.loads(pickle.dumps(s)).second.second.second is nil
+    True
+    """
+    for item in reversed(items):
+        rest = Pair(item, rest)
+    return rest
+
+class _Rest:
+    """The part of a list that remains to be printed by str_parts."""
+    def __init__(self, rest):
+        self.rest = rest
+
+def str_parts(val):
+    """Yield strings that concatenate to str(VAL).  Lists of any length and
+    depth are printed in linear time without recursion, so that output can be
+    streamed to a port.
+
+    >>> list(str_parts(read_line("(1 (2) . 3)")))
+    ['(', '1', ' ', '(', '2', ')', ' . ', '3', ')']
+    """
+    stack = [val]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, _Rest):
+            rest = x.rest
+            if isinstance(rest, Pair):
+                stack.append(_Rest(rest.second))
+                stack.append(rest.first)
+                yield " "
+            elif rest is nil:
+                yield ")"
+            else:
+                stack.append(_Rest(nil))
+                stack.append(rest)
+                yield " . "
+        elif isinstance(x, Pair):
+            stack.append(_Rest(x.second))
+            stack.append(x.first)
+            yield "("
+        else:
+            yield str(x)
+
+# Hash consing
+
+_interned = None
+
+def set_hash_consing(enabled):
+    """Turn hash consing of lists read by scheme_read on or off.  While on,
+    structurally equal lists are read as the same Pair, so that large quoted
+    data share memory and compare equal by identity.  Returns whether it was
+    previously on.
+
+    >>> old = set_hash_consing(True)
+    >>> s = read_line("((1 2) (1 2) (1 . 2) (#t 2))")
+    >>> s[0] is s[1] and s[0].second is s[3].second
+    True
+    >>> s[0] is s[2] or s[0] is s[3]
+    False
+    >>> set_hash_consing(old)
+    True
+    """
+    global _interned
+    old = _interned is not None
+    _interned = weakref.WeakValueDictionary() if enabled else None
+    return old
+
+def _cons_key(x):
+    """A hashable key for X that distinguishes values of different types, such
+    as 1, 1.0 and True.  Pairs are identified by identity, as they have been
+    hash consed already."""
+    if isinstance(x, Pair):
+        return id(x)
+    return (type(x), x)
+
+def hash_cons(first, second):
+    """Return Pair(FIRST, SECOND), or an existing equal Pair when hash consing
+    is on.  Pairs containing unhashable values, such as vectors, are not
+    shared."""
+    if _interned is None:
+        return Pair(first, second)
+    try:
+        key = (_cons_key(first), _cons_key(second))
+        pair = _interned.get(key)
+    except TypeError:
+        return Pair(first, second)
+    if pair is None:
+        pair = _interned[key] = Pair(first, second)
+    return pair
+
+# Vectors and hash tables
+
+class Vector(list):
+    """A vector is a fixed-length sequence of Scheme values with constant-time
+    indexed access.
+
+    >>> v = read_line("#(1 (2 3) x)")
+    >>> v
+    Vector([1, Pair(2, Pair(3, nil)), 'x'])
+    >>> print(v)
+    #(1 (2 3) x)
+    >>> v[1]
+    Pair(2, Pair(3, nil))
+    """
+    def __repr__(self):
+        return "Vector({0})".format(list.__repr__(self))
+
+    def __str__(self):
+        return "#(" + " ".join(map(str, self)) + ")"
+
+class HashTable(dict):
+    """A hash table maps keys to values, comparing keys with equal?.
+
+    >>> t = read_line("#hash((a . 1) ((1 2) . 2))")
+    >>> t[Pair(1, Pair(2, nil))]
+    2
+    >>> print(t)
+    #hash((a . 1) ((1 2) . 2))
+    """
+    def __repr__(self):
+        return "HashTable({0})".format(dict.__repr__(self))
+
+    def __str__(self):
+        return "#hash(" + " ".join(str(Pair(k, v)) for k, v in self.items()) + ")"
+
 # Scheme list parser
 
 
@@ -134,9 +295,18 @@ def scheme_read(src):
     elif val not in DELIMITERS:
         return val
     elif val == "'":
-        return Pair('quote', Pair(scheme_read(src), nil))
+        return hash_cons('quote', hash_cons(scheme_read(src), nil))
     elif val == "(":
         return read_tail(src)
+    elif val == "#(":
+        return Vector(read_tail(src))
+    elif val == "#hash(":
+        table = HashTable()
+        for entry in read_tail(src):
+            if not isinstance(entry, Pair):
+                raise SyntaxError("bad hash table entry: {0}".format(entry))
+            table[entry.first] = entry.second
+        return table
     else:
         raise SyntaxError("unexpected token: {0}".format(val))
 
@@ -161,22 +331,26 @@ def read_tail(src):
     Pair(1, Pair(2, Pair('quote', Pair(Pair(3, Pair(4, nil)), nil))))
     """
     try:
-        if src.current() is None:
-            raise SyntaxError("unexpected end of file")
-        if src.current() == ")":
-            src.pop()
-            return nil
-        elif src.current() == ".":
-            src.pop()
-            rest = scheme_read(src)
-            if src.current() != ")":
-                raise SyntaxError("Expected one element after .")
-            # NOTE: pop the closing parenthesis so that parsing can continue
-            src.pop()
-            return rest
-        first = scheme_read(src)
-        rest = read_tail(src)
-        return Pair(first, rest)
+        items = []
+        while True:
+            if src.current() is None:
+                raise SyntaxError("unexpected end of file")
+            if src.current() == ")":
+                src.pop()
+                rest = nil
+                break
+            elif src.current() == ".":
+                src.pop()
+                rest = scheme_read(src)
+                if src.current() != ")":
+                    raise SyntaxError("Expected one element after .")
+                # NOTE: pop the closing parenthesis so that parsing can continue
+                src.pop()
+                break
+            items.append(scheme_read(src))
+        for item in reversed(items):
+            rest = hash_cons(item, rest)
+        return rest
     except EOFError:
         raise SyntaxError("unexpected end of file")
 
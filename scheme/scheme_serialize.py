@@ -0,0 +1,278 @@
+"""A compact binary format for Scheme data.
+
+Usage: python3 scheme_serialize.py [SIZE]
+
+Benchmarks a serialize/deserialize round trip against printing and re-reading
+the same data as text.
+
+Each value is written as a one-byte tag followed by its contents:
+
+    N  nil          T  #t          F  #f          O  okay
+    i  integer      (zigzag-encoded variable-length integer)
+    d  float        (8-byte IEEE double)
+    s  string       (length and UTF-8 text, including the quotes)
+    y  symbol       (length and UTF-8 text; numbered in order of appearance)
+    Y  symbol       (the number of a symbol that appeared before)
+    L  list         (length, elements, and then the tail, usually nil)
+    V  vector       (length and elements)
+    H  hash table   (count, and then alternating keys and values)
+    R  reference    (the number of a pair, vector, or table that appeared
+                     before, so that shared and cyclic structure is kept)
+
+Pairs, vectors and tables are numbered in the order in which they appear; a
+list numbers each pair of its spine in turn.
+"""
+
+import struct
+from scheme_primitives import SchemeError, okay
+from scheme_reader import Pair, nil, Vector, HashTable
+from ucb import main
+
+MAGIC = b"SCM\x01"
+_DOUBLE = struct.Struct("<d")
+
+def serialize(value):
+    """Return the bytes encoding VALUE.
+
+    >>> from scheme_reader import read_line
+    >>> s = read_line('(1 -2 3.5 "four" five (five #t) . #f)')
+    >>> data = serialize(s)
+    >>> len(data), len(str(s))
+    (40, 42)
+    >>> deserialize(data) == s
+    True
+    """
+    encoder = _Encoder()
+    encoder.encode(value)
+    return MAGIC + bytes(encoder.out)
+
+def deserialize(data):
+    """Return the value encoded by the bytes DATA.
+
+    >>> v = Vector([1, 2])
+    >>> v.append(v)
+    >>> w = deserialize(serialize(Pair(v, Pair(v, nil))))
+    >>> w.first is w.second.first and w.first[2] is w.first
+    True
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise SchemeError("not serialized Scheme data")
+    decoder = _Decoder(data, len(MAGIC))
+    value = decoder.decode()
+    if decoder.pos != len(data):
+        raise SchemeError("trailing bytes after serialized Scheme data")
+    return value
+
+class _Encoder:
+    def __init__(self):
+        self.out = bytearray()
+        self.objects = {}  # id of each pair, vector, and table -> number
+        self.symbols = {}
+
+    def varint(self, n):
+        """Write the non-negative integer N, seven bits per byte."""
+        out = self.out
+        while n >= 0x80:
+            out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def text(self, tag, s):
+        data = s.encode("utf-8")
+        self.out += tag
+        self.varint(len(data))
+        self.out += data
+
+    def register(self, obj):
+        """Number OBJ, returning False if it has been numbered before, in which
+        case a reference to it is written instead."""
+        k = self.objects.get(id(obj))
+        if k is not None:
+            self.out += b"R"
+            self.varint(k)
+            return False
+        self.objects[id(obj)] = len(self.objects)
+        return True
+
+    def encode(self, x):
+        out = self.out
+        if x is nil:
+            out += b"N"
+        elif x is True:
+            out += b"T"
+        elif x is False:
+            out += b"F"
+        elif x is okay:
+            out += b"O"
+        elif type(x) is int:
+            out += b"i"
+            self.varint(2 * x if x >= 0 else -2 * x - 1)
+        elif type(x) is float:
+            out += b"d" + _DOUBLE.pack(x)
+        elif isinstance(x, str):
+            if x.startswith('"'):
+                self.text(b"s", x)
+            elif x in self.symbols:
+                out += b"Y"
+                self.varint(self.symbols[x])
+            else:
+                self.symbols[x] = len(self.symbols)
+                self.text(b"y", x)
+        elif isinstance(x, Pair):
+            if self.register(x):
+                self.encode_list(x)
+        elif isinstance(x, Vector):
+            if self.register(x):
+                out += b"V"
+                self.varint(len(x))
+                for item in x:
+                    self.encode(item)
+        elif isinstance(x, HashTable):
+            if self.register(x):
+                out += b"H"
+                self.varint(len(x))
+                for key, value in x.items():
+                    self.encode(key)
+                    self.encode(value)
+        else:
+            raise SchemeError("cannot serialize {0}".format(x))
+
+    def encode_list(self, x):
+        """Write the list starting with the already numbered pair X.  The spine
+        ends at the first pair that has been numbered before."""
+        items, rest = [x.first], x.second
+        while isinstance(rest, Pair) and id(rest) not in self.objects:
+            self.objects[id(rest)] = len(self.objects)
+            items.append(rest.first)
+            rest = rest.second
+        self.out += b"L"
+        self.varint(len(items))
+        for item in items:
+            self.encode(item)
+        self.encode(rest)
+
+class _Decoder:
+    def __init__(self, data, pos):
+        self.data = data
+        self.pos = pos
+        self.objects = []
+        self.symbols = []
+
+    def varint(self):
+        data, pos = self.data, self.pos
+        n = data[pos]
+        if n < 0x80:  # Most lengths and numbers fit in one byte
+            self.pos = pos + 1
+            return n
+        n = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            n |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                self.pos = pos
+                return n
+            shift += 7
+
+    def text(self):
+        n = self.varint()
+        start, self.pos = self.pos, self.pos + n
+        return self.data[start:self.pos].decode("utf-8")
+
+    def decode(self):
+        try:
+            tag = self.data[self.pos]
+            self.pos += 1
+            return self.decoders[tag](self)
+        except (KeyError, IndexError, struct.error, UnicodeDecodeError):
+            raise SchemeError("corrupt serialized Scheme data")
+
+    def decode_int(self):
+        n = self.varint()
+        return n >> 1 if n & 1 == 0 else -(n >> 1) - 1
+
+    def decode_float(self):
+        value, = _DOUBLE.unpack_from(self.data, self.pos)
+        self.pos += _DOUBLE.size
+        return value
+
+    def decode_symbol(self):
+        symbol = self.text()
+        self.symbols.append(symbol)
+        return symbol
+
+    def decode_list(self):
+        n = self.varint()
+        pairs = [Pair(None, nil) for _ in range(n)]
+        for i in range(n - 1):
+            pairs[i].second = pairs[i + 1]
+        self.objects.extend(pairs)
+        for pair in pairs:
+            pair.first = self.decode()
+        pairs[-1].second = self.decode()
+        return pairs[0]
+
+    def decode_vector(self):
+        v = Vector()
+        self.objects.append(v)
+        n = self.varint()
+        for _ in range(n):
+            v.append(self.decode())
+        return v
+
+    def decode_table(self):
+        table = HashTable()
+        self.objects.append(table)
+        for _ in range(self.varint()):
+            key = self.decode()
+            table[key] = self.decode()
+        return table
+
+    decoders = {
+        ord("N"): lambda self: nil,
+        ord("T"): lambda self: True,
+        ord("F"): lambda self: False,
+        ord("O"): lambda self: okay,
+        ord("i"): decode_int,
+        ord("d"): decode_float,
+        ord("s"): text,
+        ord("y"): decode_symbol,
+        ord("Y"): lambda self: self.symbols[self.varint()],
+        ord("L"): decode_list,
+        ord("V"): decode_vector,
+        ord("H"): decode_table,
+        ord("R"): lambda self: self.objects[self.varint()],
+    }
+
+@main
+def run(size='100000'):
+    import time
+    from scheme_reader import scheme_read, Buffer
+    from scheme_tokens import tokenize_lines
+    size = int(size)
+    rows = [Pair(k, Pair("name", Pair(k * 0.5, Pair('"row"', nil))))
+            for k in range(size)]
+    data = nil
+    for row in reversed(rows):
+        data = Pair(row, data)
+
+    def timed(fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - start
+
+    encoded, t_ser = timed(serialize, data)
+    decoded, t_de = timed(deserialize, encoded)
+    assert decoded == data
+    def write_text(rows):
+        return "(" + "\n".join(map(str, rows)) + ")"
+    def read_text(text):
+        return scheme_read(Buffer(tokenize_lines(text.split("\n"))))
+    text, t_str = timed(write_text, rows)
+    reread, t_read = timed(read_text, text)
+    assert reread == data
+    print("{0} rows".format(size))
+    print("binary: {0:>9} bytes, write {1:.3f}s, read {2:.3f}s".format(
+        len(encoded), t_ser, t_de))
+    print("text:   {0:>9} bytes, write {1:.3f}s, read {2:.3f}s".format(
+        len(text), t_str, t_read))
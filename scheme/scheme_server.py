@@ -0,0 +1,358 @@
+"""An asyncio server that hosts many independent Scheme sessions.
+
+Usage: python3 scheme_server.py [--unix PATH | --port PORT] [--load FILE ...]
+       python3 scheme_server.py --load-test ADDRESS [--clients N]
+
+Each session has its own global frame, and all sessions share one frozen frame
+containing the primitives and any prelude files given with --load.  Sessions
+are pinned to a pool of worker processes, so evaluations run in parallel and a
+runaway evaluation cannot stall the event loop.  Every request carries a step
+budget (see scheme.set_step_budget), at most the server's --budget.
+
+The budget limits steps, not memory: (make-vector 100000000 0) is one step.
+The frozen frame keeps each session's bindings to itself, but the values it
+binds are shared, so a session that mutates a prelude vector or pair changes
+it for every session on the same worker.  Load only preludes whose values
+are not mutated, or give them mutable state through procedures that build it
+afresh.
+
+Requests and responses are newline-delimited JSON objects.  A client sends
+
+    {"session": "s1", "source": "(define x 2) (display x)", "budget": 10000}
+
+and receives any number of {"output": TEXT} messages as the program displays
+values, one {"value": TEXT} message per expression evaluated, and finally
+{"done": true} or {"error": MESSAGE, "done": true}.  Sending
+{"session": "s1", "close": true} discards the session.
+"""
+
+import asyncio
+import json
+import sys
+import time
+import zlib
+from ucb import main
+
+DEFAULT_BUDGET = 1000000
+DEFAULT_WORKERS = 4
+
+##########
+# Worker #
+##########
+
+class _StreamingOutput:
+    """A file-like object that forwards everything written to it as output
+    messages for request ID over the PROTOCOL stream."""
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.id = None
+
+    def write(self, text):
+        if text:
+            _send(self.protocol, {"id": self.id, "output": text})
+        return len(text)
+
+    def flush(self):
+        self.protocol.flush()
+
+def _send(stream, message):
+    stream.write(json.dumps(message) + "\n")
+    stream.flush()
+
+def request_budget(budget, ceiling):
+    """The step budget for a request that asks for BUDGET steps, at most
+    CEILING.  Raises ValueError unless BUDGET is a positive integer.
+
+    >>> request_budget(500, 1000), request_budget(5000, 1000)
+    (500, 1000)
+    >>> request_budget(None, 1000)
+    Traceback (most recent call last):
+        ...
+    ValueError: budget must be a positive integer
+    """
+    if type(budget) != int or budget <= 0:
+        raise ValueError("budget must be a positive integer")
+    return min(budget, ceiling)
+
+def run_worker(load_files=(), ceiling=DEFAULT_BUDGET):
+    """Serve requests read from stdin as JSON lines, writing responses to
+    stdout.  Sessions created by this worker share one frozen frame, and no
+    request runs for more than CEILING steps."""
+    from scheme import (Frame, FrozenFrame, create_global_frame, scheme_eval,
+                        scheme_load, set_step_budget)
+    from scheme_reader import scheme_read, Buffer
+    from scheme_tokens import tokenize_lines
+
+    protocol, sys.stdout = sys.stdout, sys.stderr  # Prelude output to stderr
+    env = create_global_frame()
+    for filename in load_files:
+        scheme_load(filename, True, env)
+    base = FrozenFrame(env)
+    out = sys.stdout = _StreamingOutput(protocol)
+    sessions = {}
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        rid, name = request["id"], request["session"]
+        out.id = rid
+        if request.get("close"):
+            sessions.pop(name, None)
+            _send(protocol, {"id": rid, "done": True})
+            continue
+        if name not in sessions:
+            sessions[name] = Frame(base)
+        env = sessions[name]
+        reply = {"id": rid, "done": True}
+        try:
+            set_step_budget(request_budget(request.get("budget", ceiling),
+                                           ceiling))
+            src = Buffer(tokenize_lines(request["source"].split("\n")))
+            while src.current() is not None:
+                result = scheme_eval(scheme_read(src), env)
+                if result is not None:
+                    _send(protocol, {"id": rid, "value": str(result)})
+        except EOFError:  # (exit) ends the session
+            sessions.pop(name, None)
+        except RecursionError:
+            reply["error"] = "maximum recursion depth exceeded"
+        except Exception as err:
+            reply["error"] = "{0}: {1}".format(type(err).__name__, err)
+        finally:
+            set_step_budget(None)
+        _send(protocol, reply)
+
+##########
+# Server #
+##########
+
+class WorkerProcess:
+    """A worker subprocess that evaluates one request at a time."""
+
+    def __init__(self, proc):
+        self.proc = proc
+        self.lock = asyncio.Lock()
+        self.next_id = 0
+
+    async def request(self, message, respond):
+        """Send MESSAGE to the worker and pass each response to the coroutine
+        function RESPOND, until the request is done.  The worker's responses
+        are read to the end even if RESPOND raises a ConnectionError, which is
+        raised again once the worker is ready for the next request, and any
+        responses to earlier requests are discarded.
+
+        >>> async def check():
+        ...     server = SchemeServer(num_workers=1)
+        ...     await server.start_workers()
+        ...     worker, responses = server.workers[0], []
+        ...     async def hang_up(response):
+        ...         raise ConnectionError("client disconnected")
+        ...     async def collect(response):
+        ...         responses.append(response)
+        ...     loop = ("(define (f n) (if (> n 0)"
+        ...             " (begin (display n) (f (- n 1)))))")
+        ...     try:
+        ...         await worker.request({"session": "a",
+        ...                               "source": loop + " (f 50)"}, hang_up)
+        ...     except ConnectionError as err:
+        ...         print(err)
+        ...     await worker.request({"session": "b", "source": "(+ 1 2)"},
+        ...                          collect)
+        ...     await server.stop_workers()
+        ...     return responses
+        >>> asyncio.run(check())
+        client disconnected
+        [{'value': '3'}, {'done': True}]
+        """
+        async with self.lock:
+            self.next_id += 1
+            rid = self.next_id
+            message = dict(message, id=rid)
+            self.proc.stdin.write((json.dumps(message) + "\n").encode())
+            await self.proc.stdin.drain()
+            error = None
+            while True:
+                line = await self.proc.stdout.readline()
+                if not line:
+                    response = {"error": "worker exited", "done": True}
+                else:
+                    response = json.loads(line)
+                    if response.pop("id", None) != rid:
+                        continue
+                if error is None:
+                    try:
+                        await respond(response)
+                    except ConnectionError as err:
+                        error = err
+                if response.get("done"):
+                    break
+            if error is not None:
+                raise error
+
+class SchemeServer:
+    """Routes the requests of each session to the worker that hosts it."""
+
+    def __init__(self, num_workers=DEFAULT_WORKERS, load_files=(),
+                 budget=DEFAULT_BUDGET):
+        self.num_workers = num_workers
+        self.load_files = load_files
+        self.budget = budget
+        self.workers = []
+
+    async def start_workers(self):
+        args = [sys.executable, __file__, "--worker",
+                "--budget", str(self.budget)]
+        for filename in self.load_files:
+            args += ["--load", filename]
+        for _ in range(self.num_workers):
+            proc = await asyncio.create_subprocess_exec(
+                *args, stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE)
+            self.workers.append(WorkerProcess(proc))
+
+    async def stop_workers(self):
+        """Close the input of each worker and wait for it to exit."""
+        for worker in self.workers:
+            worker.proc.stdin.close()
+            await worker.proc.wait()
+        self.workers = []
+
+    def worker_for(self, session):
+        """The worker that hosts SESSION; stable for the server's lifetime."""
+        index = zlib.crc32(session.encode()) % len(self.workers)
+        return self.workers[index]
+
+    async def handle_client(self, reader, writer):
+        async def respond(response):
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    session = str(request["session"])
+                except (ValueError, KeyError, TypeError):
+                    await respond({"error": "malformed request", "done": True})
+                    continue
+                try:
+                    budget = request_budget(request.get("budget", self.budget),
+                                            self.budget)
+                except ValueError as err:
+                    await respond({"error": str(err), "done": True})
+                    continue
+                message = {"session": session,
+                           "source": request.get("source", ""),
+                           "budget": budget,
+                           "close": bool(request.get("close"))}
+                await self.worker_for(session).request(message, respond)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8642, path=None):
+        await self.start_workers()
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+##########
+# Client #
+##########
+
+async def open_connection(address):
+    """Connect to ADDRESS, either "unix:PATH" or "HOST:PORT"."""
+    if address.startswith("unix:"):
+        return await asyncio.open_unix_connection(address[len("unix:"):])
+    host, port = address.rsplit(":", 1)
+    return await asyncio.open_connection(host, int(port))
+
+async def evaluate(reader, writer, session, source, budget=None):
+    """Evaluate SOURCE in SESSION over an open connection.  Returns the list
+    of response messages."""
+    request = {"session": session, "source": source}
+    if budget is not None:
+        request["budget"] = budget
+    writer.write((json.dumps(request) + "\n").encode())
+    await writer.drain()
+    responses = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        responses.append(json.loads(line))
+        if responses[-1].get("done"):
+            return responses
+
+def percentile(sorted_values, p):
+    """The P-th percentile (0 to 100) of a non-empty sorted list.
+
+    >>> percentile([1, 2, 3, 4], 50)
+    2
+    >>> percentile(list(range(1, 101)), 99)
+    99
+    """
+    k = max(0, -(-len(sorted_values) * p // 100) - 1)
+    return sorted_values[int(k)]
+
+async def load_test(address, num_clients=16, num_requests=100,
+                    source="(define (f n) (if (= n 0) 0 (+ n (f (- n 1))))) (f 100)"):
+    """Run NUM_CLIENTS concurrent clients, each with its own session, sending
+    NUM_REQUESTS requests of SOURCE.  Returns a sorted list of latencies."""
+    latencies = []
+    async def client(k):
+        reader, writer = await open_connection(address)
+        try:
+            for _ in range(num_requests):
+                start = time.perf_counter()
+                await evaluate(reader, writer, "load-{0}".format(k), source)
+                latencies.append(time.perf_counter() - start)
+        finally:
+            writer.close()
+    start = time.perf_counter()
+    await asyncio.gather(*(client(k) for k in range(num_clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print("{0} requests in {1:.2f}s ({2:.0f} requests/s)".format(
+        len(latencies), elapsed, len(latencies) / elapsed))
+    print("p50 {0:.2f}ms, p99 {1:.2f}ms".format(
+        1000 * percentile(latencies, 50), 1000 * percentile(latencies, 99)))
+    return latencies
+
+@main
+def run(*args):
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve Scheme sessions")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8642)
+    parser.add_argument('--unix', metavar='PATH',
+                        help='Listen on a Unix socket instead of TCP')
+    parser.add_argument('--load', action='append', default=[],
+                        metavar='FILE', help='Load FILE into the shared prelude')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--budget', type=int, default=DEFAULT_BUDGET,
+                        help='Default and largest step budget per request')
+    parser.add_argument('--load-test', metavar='ADDRESS',
+                        help='Load test a running server at unix:PATH or '
+                             'HOST:PORT')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(args)
+
+    if args.worker:
+        run_worker(args.load, args.budget)
+    elif args.load_test:
+        asyncio.run(load_test(args.load_test, args.clients, args.requests))
+    else:
+        server = SchemeServer(args.workers, args.load, args.budget)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
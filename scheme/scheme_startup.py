@@ -0,0 +1,149 @@
+"""A benchmark of the time taken to start the interpreter.
+
+Usage: python3 scheme_startup.py [--runs N] [--ratio R | --budget MS] [FILE]
+
+Runs python3 scheme.py FILE a number of times and reports the median time it
+takes beyond starting Python itself, along with the slowest imports reported
+by python3 -X importtime.  Exits with status 1 if that time exceeds the budget
+or if a module that should only be imported on first use (such as turtle or
+readline) is imported by a run that does not use it.
+
+The budget is measured against Python itself, so that it holds on fast and
+slow machines alike: by default, startup may take DEFAULT_RATIO times as long
+as running python3 -c pass.  (Before imports were deferred, it took about six
+times as long; afterwards, between one and three times.)  A fixed budget in
+milliseconds can be given with --budget, or with the SCHEME_STARTUP_BUDGET
+environment variable, as in
+
+    SCHEME_STARTUP_BUDGET=60 python3 scheme_startup.py
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from ucb import main
+
+DEFAULT_RATIO = 3.0  # Startup allowed for each millisecond Python takes
+BUDGET_VARIABLE = "SCHEME_STARTUP_BUDGET"  # A budget in milliseconds
+DEFAULT_RUNS = 20
+PROGRAM = "(define (square x) (* x x))\n(square 12)\n"
+
+# Modules that a short script should never import
+LAZY_MODULES = ("turtle", "tkinter", "readline", "json", "concurrent.futures",
+                "inspect", "tokenize", "scheme_turtle", "scheme_serialize")
+
+def _environment():
+    """An environment for child interpreters that caches compiled modules,
+    as an installed interpreter would."""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+def wall_times(args, runs):
+    """The wall-clock times in milliseconds of RUNS runs of Python with the
+    command line arguments ARGS."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, env=_environment(),
+                       stdout=subprocess.DEVNULL, check=True)
+        times.append(1000 * (time.perf_counter() - start))
+    return times
+
+def parse_importtime(report):
+    """A list of (module, self, cumulative, depth) tuples for each import in
+    REPORT, the standard error of python3 -X importtime.  Times are in
+    microseconds, and the depth of a module imported directly by the program
+    is 0.
+
+    >>> parse_importtime('''import time: self [us] | cumulative | imported package
+    ... import time:       120 |        120 |   math
+    ... import time:       300 |        420 | scheme_primitives''')
+    [('math', 120, 120, 1), ('scheme_primitives', 300, 420, 0)]
+    """
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # The header
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), own, cumulative, depth))
+    return imports
+
+def import_times(args):
+    """The imports of a run of Python with the command line arguments ARGS."""
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args,
+                            env=_environment(), stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True,
+                            check=True)
+    return parse_importtime(result.stderr)
+
+def benchmark(filename, runs=DEFAULT_RUNS, budget=None, ratio=DEFAULT_RATIO):
+    """Report the startup time of scheme.py on FILENAME.  Returns whether it
+    is within BUDGET milliseconds (by default, RATIO times the time taken to
+    start Python) and imports none of LAZY_MODULES."""
+    scheme = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "scheme.py")
+    args = [scheme, filename]
+    wall_times(args, 1)  # Compile and cache every module first
+    python = statistics.median(wall_times(["-c", "pass"], runs))
+    total = statistics.median(wall_times(args, runs))
+    startup = total - python
+    if budget is None:
+        budget = ratio * python
+    print("python:      {0:6.1f} ms".format(python))
+    print("scheme.py:   {0:6.1f} ms".format(total))
+    print("startup:     {0:6.1f} ms (budget {1:.1f} ms)".format(startup,
+                                                              budget))
+
+    imports = import_times(args)
+    print("slowest imports (cumulative ms):")
+    top_level = [i for i in imports if i[3] == 0]
+    for name, _, cumulative, _ in sorted(top_level, key=lambda i: -i[2])[:8]:
+        print("    {0:6.1f}  {1}".format(cumulative / 1000, name))
+
+    ok = startup <= budget
+    if not ok:
+        print("startup exceeds its budget of {0:.1f} ms".format(budget))
+    loaded = {i[0] for i in imports}
+    for module in LAZY_MODULES:
+        if module in loaded:
+            print("{0} was imported but should load on first use".format(
+                module))
+            ok = False
+    return ok
+
+@main
+def run(*args):
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark startup time")
+    parser.add_argument('file', nargs='?',
+                        help='Scheme file to run (default: a short program)')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS,
+                        help='Number of timed runs')
+    parser.add_argument('--ratio', type=float, default=DEFAULT_RATIO,
+                        help='Allowed startup time as a multiple of the time '
+                             'taken to start Python')
+    parser.add_argument('--budget', type=float,
+                        default=os.environ.get(BUDGET_VARIABLE),
+                        help='Allowed startup time in milliseconds, instead '
+                             'of a ratio (default: ${0})'.format(
+                                 BUDGET_VARIABLE))
+    args = parser.parse_args(args)
+
+    if args.file:
+        ok = benchmark(args.file, args.runs, args.budget, args.ratio)
+    else:
+        with tempfile.NamedTemporaryFile("w", suffix=".scm") as f:
+            f.write(PROGRAM)
+            f.flush()
+            ok = benchmark(f.name, args.runs, args.budget, args.ratio)
+    sys.exit(0 if ok else 1)
@@ -13,6 +13,7 @@ Differences between printed and expected outputs are printed with line numbers.
 """
 
 import io
+import os
 import sys
 from buffer import Buffer
 from scheme import read_eval_print_loop, create_global_frame
@@ -41,7 +42,12 @@ def summarize(output, expected_output):
 EXPECT_STRING = '; expect'
 
 class TestReader:
-    """A TestReader is an iterable that collects test case expected results."""
+    """A TestReader is an iterable that collects test case expected results.
+
+    It reads LINES, an iterable such as an open file, one line at a time, and
+    discards the printed output in STDOUT (a StringIO) once it has been
+    compared, so that memory does not grow with the length of the tests.
+    """
     def __init__(self, lines, stdout):
         self.lines = lines
         self.stdout = stdout
@@ -63,7 +69,11 @@ class TestReader:
                     self.output.extend(out_lines[-1-len(expected):-1])
                 else:
                     self.output.extend([''] * len(expected))
-                self.last_out_len = len(out_lines)
+                # Keep only the unfinished last line of output
+                self.stdout.seek(0)
+                self.stdout.truncate()
+                self.stdout.write(out_lines[-1])
+                self.last_out_len = 1
             yield line
         raise EOFError
 
@@ -71,9 +81,10 @@ class TestReader:
 def run_tests(src_file='tests.scm'):
     """Run a read-eval loop that reads from src_file and collects outputs."""
     sys.stderr = sys.stdout = io.StringIO() # Collect output to stdout and stderr
+    os.environ.setdefault("SCHEME_TURTLE", "none")  # Draw without a window
     reader = None
     try:
-        reader = TestReader(open(src_file).readlines(), sys.stdout)
+        reader = TestReader(open(src_file), sys.stdout)
         src = Buffer(tokenize_lines(reader))
         def next_line():
             src.current()
@@ -5,7 +5,8 @@ of tokens.  A token may be:
   * A number (represented as an int or float)
   * A boolean (represented as a bool)
   * A symbol (represented as a string)
-  * A delimiter, including parentheses, dots, and single quotes
+  * A delimiter, including parentheses, dots, single quotes, and the openers
+    #( and #hash( of vector and hash table literals
 
 This file also includes some features of Scheme that have not been addressed
 in the course, such as quasiquoting and Scheme strings.
@@ -13,18 +14,18 @@ in the course, such as quasiquoting and Scheme strings.
 
 from ucb import main
 import itertools
-import string
 import sys
-import tokenize
 
-_NUMERAL_STARTS = set(string.digits) | set('+-.')
-_SYMBOL_CHARS = (set('!$%&*/:<=>?@^_~') | set(string.ascii_lowercase) |
-                 set(string.ascii_uppercase) | _NUMERAL_STARTS)
+_DIGITS = '0123456789'  # As in the string module, which imports re slowly
+_LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+_NUMERAL_STARTS = set(_DIGITS) | set('+-.')
+_SYMBOL_CHARS = (set('!$%&*/:<=>?@^_~') | set(_LETTERS) |
+                 set(_LETTERS.upper()) | _NUMERAL_STARTS)
 _STRING_DELIMS = set('"')
 _WHITESPACE = set(' \t\n\r')
 _SINGLE_CHAR_TOKENS = set("()'`")
 _TOKEN_END = _WHITESPACE | _SINGLE_CHAR_TOKENS | _STRING_DELIMS | {',', ',@'}
-DELIMITERS = _SINGLE_CHAR_TOKENS | {'.', ',', ',@'}
+DELIMITERS = _SINGLE_CHAR_TOKENS | {'.', ',', ',@', '#(', '#hash('}
 
 def valid_symbol(s):
     """Returns whether s is not a well-formed value."""
@@ -48,7 +49,9 @@ def next_candidate_token(line, k):
             k += 1
         elif c in _SINGLE_CHAR_TOKENS:
             return c, k+1
-        elif c == '#':  # Boolean values #t and #f
+        elif c == '#':  # Boolean values #t and #f, vectors, and hash tables
+            if line.startswith('#hash(', k):
+                return '#hash(', k+6
             return line[k:k+2], min(k+2, len(line))
         elif c == ',': # Unquote; check for @
             if k+1 < len(line) and line[k+1] == '@':
@@ -57,6 +60,7 @@ def next_candidate_token(line, k):
         elif c in _STRING_DELIMS:
             if k+1 < len(line) and line[k+1] == c: # No triple quotes in Scheme
                 return c+c, k+2
+            import tokenize  # Slow to import, and only needed for strings
             line_bytes = (bytes(line[k:], encoding='utf-8'),)
             gen = tokenize.tokenize(iter(line_bytes).__next__)
             next(gen) # Throw away encoding token
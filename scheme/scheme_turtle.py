@@ -0,0 +1,456 @@
+"""Turtle graphics backends for the Scheme turtle primitives.
+
+A turtle records what it draws in a display list rather than drawing each
+stroke as it moves.  Each entry of the display list is a triple
+
+    ("line", COLOR, COORDS)   a connected run of strokes through the points
+                              COORDS, a flat list [x0, y0, x1, y1, ...]
+    ("fill", COLOR, COORDS)   a filled polygon with corners COORDS
+
+Consecutive strokes in the same color are appended to the same line, so a
+drawing of a million segments is a handful of entries that can be rendered in
+bulk.  The headless Turtle renders its display list to SVG or PostScript and
+needs neither Tk nor a display; TkTurtle also draws the display list on a Tk
+canvas in batches.
+
+The backend used by the primitives is chosen by the SCHEME_TURTLE environment
+variable: "tk" (the default) draws in a window, "none" only records, and a file
+name ending in .svg, .ps or .eps records and then renders to that file when the
+program exits.  If Tk or a display is unavailable, the headless turtle is used.
+"""
+
+import math
+import os
+import sys
+
+BATCH_SIZE = 1000  # Turtle commands between updates of a Tk window
+
+class Turtle:
+    """A headless turtle in logo mode: heading 0 is north, and headings
+    increase clockwise.
+
+    >>> t = Turtle()
+    >>> t.forward(10)
+    >>> t.right(90)
+    >>> t.forward(5)
+    >>> t.color("red")
+    >>> t.backward(5)
+    >>> t.display_list
+    [('line', 'black', [0, 0, 0.0, 10.0, 5.0, 10.0]), ('line', 'red', [5.0, 10.0, 0.0, 10.0])]
+    >>> t.penup()
+    >>> t.setposition(0, 0)
+    >>> t.pendown()
+    >>> t.circle(10)
+    >>> len(t.display_list[-1][2]) // 2 - 1  # Segments in the circle
+    13
+    >>> round(t.x, 6) + 0.0, round(t.y, 6) + 0.0, round(t.heading) % 360
+    (0.0, 0.0, 90)
+    """
+
+    def __init__(self, output=None):
+        self.output = output
+        self.x, self.y, self.heading = 0, 0, 0
+        self.pen = self.visible = True
+        self.color_name = "black"
+        self.speed = 0
+        self.reset()
+
+    def reset(self):
+        """Clear the drawing, leaving the turtle unchanged."""
+        self.display_list = []
+        self.path = None      # Coordinates of the line being extended
+        self.fill = None      # (Index, corners) of the fill being outlined
+
+    def changed(self):
+        """Called after each command; backends that draw override this."""
+
+    def _move(self, x, y):
+        if self.pen:
+            path = self.path
+            if path is None or path[-2] != self.x or path[-1] != self.y:
+                path = self.path = [self.x, self.y]
+                self.display_list.append(("line", self.color_name, path))
+            path.append(x)
+            path.append(y)
+        if self.fill is not None:
+            self.fill[1].extend((x, y))
+        self.x, self.y = x, y
+
+    def forward(self, n):
+        angle = math.radians(self.heading)
+        self._move(self.x + n * math.sin(angle), self.y + n * math.cos(angle))
+        self.changed()
+
+    def backward(self, n):
+        self.forward(-n)
+
+    def left(self, n):
+        self.heading -= n
+        self.changed()
+
+    def right(self, n):
+        self.heading += n
+        self.changed()
+
+    def circle(self, r, extent=None):
+        """Draw an arc of EXTENT degrees with center R units to the left, as a
+        polygon with as many sides as the turtle module would use."""
+        if extent is None:
+            extent = 360
+        steps = 1 + int(min(11 + abs(r) / 6, 59) * abs(extent) / 360)
+        w = extent / steps
+        w2 = w / 2
+        length = 2 * r * math.sin(math.radians(w2))
+        if r < 0:
+            length, w, w2 = -length, -w, -w2
+        self.heading -= w2
+        for _ in range(steps):
+            angle = math.radians(self.heading)
+            self._move(self.x + length * math.sin(angle),
+                       self.y + length * math.cos(angle))
+            self.heading -= w
+        self.heading += w2
+        self.changed()
+
+    def setposition(self, x, y):
+        self._move(x, y)
+        self.changed()
+
+    def setheading(self, h):
+        self.heading = h
+        self.changed()
+
+    def penup(self):
+        self.pen = False
+        self.path = None
+
+    def pendown(self):
+        self.pen = True
+
+    def showturtle(self):
+        self.visible = True
+
+    def hideturtle(self):
+        self.visible = False
+
+    def clear(self):
+        self.reset()
+        self.changed()
+
+    def color(self, color):
+        """Draw in COLOR.  Raises ValueError if it is not a known color.
+
+        >>> Turtle().color("<blue>")
+        Traceback (most recent call last):
+            ...
+        ValueError: unknown color <blue>
+        """
+        if not self.known_color(color):
+            raise ValueError("unknown color " + color)
+        self.color_name = color
+        self.path = None
+
+    def known_color(self, color):
+        """Whether COLOR is a color name of _RGB or a #rgb or #rrggbb
+        hexadecimal color, which every renderer can draw."""
+        try:
+            _rgb(color)
+        except ValueError:
+            return False
+        return True
+
+    def set_speed(self, s):
+        self.speed = s
+
+    def begin_fill(self):
+        # The fill is placed before the strokes that outline it
+        self.fill = (len(self.display_list), [self.x, self.y])
+        self.display_list.append(("fill", None, None))
+        self.path = None
+
+    def end_fill(self):
+        if self.fill is not None:
+            index, corners = self.fill
+            self.display_list[index] = ("fill", self.color_name, corners)
+            self.fill = None
+            self.changed()
+
+    def exitonclick(self):
+        """Finish the drawing, writing it to the output file if there is
+        one."""
+        if self.output:
+            self.save(self.output)
+            self.output = None
+
+    def save(self, filename):
+        """Render the drawing to FILENAME, as SVG or PostScript according to
+        its extension."""
+        if filename.endswith(".svg"):
+            render = to_svg
+        elif filename.endswith((".ps", ".eps")):
+            render = to_postscript
+        else:
+            raise ValueError("cannot save a drawing as " + filename)
+        with open(filename, "w") as f:
+            f.write(render(self.display_list))
+
+class TkTurtle(Turtle):
+    """A turtle that draws its display list in a Tk window, updating the
+    window once every BATCH_SIZE commands instead of animating each stroke."""
+
+    TAG = "scheme"
+
+    def __init__(self, output=None):
+        import turtle  # Imported here so that headless runs never load Tk
+        self.turtle = turtle
+        turtle.title("Scheme Turtles")
+        turtle.mode("logo")
+        turtle.tracer(0, 0)
+        turtle.penup()
+        self.canvas = turtle.getcanvas()
+        super().__init__(output)
+        self.pending = 0
+
+    def reset(self):
+        super().reset()
+        self.drawn = 0         # Entries of the display list drawn so far
+        self.drawn_coords = 0  # Coordinates drawn of the next entry
+
+    def changed(self):
+        self.pending += 1
+        if self.pending >= (self.speed and 1 or BATCH_SIZE):
+            self.update()
+
+    def update(self):
+        """Draw the entries of the display list added since the last update,
+        and move the turtle's cursor to its current position."""
+        entries, canvas = self.display_list, self.canvas
+        while self.drawn < len(entries):
+            kind, color, coords = entries[self.drawn]
+            if coords is None:
+                break  # Wait for the end of a fill
+            if kind == "fill":
+                canvas.create_polygon(_flip(coords), fill=color, outline="",
+                                      tags=self.TAG)
+            else:
+                new = coords[max(self.drawn_coords - 2, 0):]
+                if len(new) >= 4:
+                    canvas.create_line(_flip(new), fill=color, tags=self.TAG,
+                                       capstyle="round", joinstyle="round")
+                if self.drawn == len(entries) - 1:
+                    self.drawn_coords = len(coords)
+                    break
+            self.drawn, self.drawn_coords = self.drawn + 1, 0
+        self.turtle.goto(self.x, self.y)
+        self.turtle.setheading(self.heading)
+        self.turtle.update()
+        self.pending = 0
+
+    def showturtle(self):
+        super().showturtle()
+        self.turtle.showturtle()
+
+    def hideturtle(self):
+        super().hideturtle()
+        self.turtle.hideturtle()
+
+    def clear(self):
+        self.canvas.delete(self.TAG)
+        super().clear()
+
+    def known_color(self, color):
+        """Whether Tk knows COLOR."""
+        try:
+            self.canvas.winfo_rgb(color)
+        except Exception:
+            return False
+        return True
+
+    def color(self, color):
+        super().color(color)
+        self.turtle.color(color)
+
+    def exitonclick(self):
+        self.update()
+        super().exitonclick()
+        print("Close or click on turtle window to complete exit")
+        self.turtle.exitonclick()
+
+def _flip(coords):
+    """Canvas coordinates for the points COORDS, whose y axis points down."""
+    flipped = list(coords)
+    flipped[1::2] = [-y for y in coords[1::2]]
+    return flipped
+
+_backend = None
+
+def backend():
+    """The turtle used by the turtle primitives, created on first use."""
+    global _backend
+    if _backend is None:
+        choice = os.environ.get("SCHEME_TURTLE", "tk")
+        if choice == "tk":
+            try:
+                _backend = TkTurtle()
+            except Exception:
+                print("warning: could not open a turtle window; drawing "
+                      "headless.", file=sys.stderr)
+                _backend = Turtle()
+        else:
+            _backend = Turtle(None if choice == "none" else choice)
+    return _backend
+
+def active():
+    """Whether the turtle primitives have been used."""
+    return _backend is not None
+
+def finish():
+    """Finish the current drawing; the next turtle command starts a new one."""
+    global _backend
+    if _backend is not None:
+        _backend.exitonclick()
+        _backend = None
+
+
+#############
+# Rendering #
+#############
+
+MARGIN = 10
+
+def _bounds(display_list):
+    """The bounding box (x0, y0, x1, y1) of the points of DISPLAY_LIST."""
+    xs, ys = [0], [0]
+    for _, _, coords in display_list:
+        if coords:
+            xs += (min(coords[0::2]), max(coords[0::2]))
+            ys += (min(coords[1::2]), max(coords[1::2]))
+    return tuple(round(v, 2) for v in (min(xs), min(ys), max(xs), max(ys)))
+
+def _points(coords, fmt):
+    """Format the points COORDS, rounded to hundredths."""
+    return [fmt % (round(x, 2) + 0.0, round(y, 2) + 0.0)
+            for x, y in zip(coords[0::2], coords[1::2])]
+
+def to_svg(display_list):
+    """Render DISPLAY_LIST as an SVG document.
+
+    >>> print(to_svg([("line", "red", [0, 0, 10, 20]),
+    ...               ("fill", "#00ff00", [0, 0, 5, 0, 5, -5])]))
+    <svg xmlns="http://www.w3.org/2000/svg" width="30" height="45" viewBox="-10 -30 30 45">
+    <rect x="-10" y="-30" width="30" height="45" fill="white"/>
+    <g fill="none" stroke-linecap="round" stroke-linejoin="round">
+    <path stroke="red" d="M0 0 L10 -20"/>
+    <path fill="#00ff00" d="M0 0 L5 0 5 5 Z"/>
+    </g>
+    </svg>
+
+    Colors are quoted as XML attributes.
+
+    >>> print(to_svg([("line", '"/><x a="&', [0, 0, 1, 1])]).splitlines()[3])
+    <path stroke='"/&gt;&lt;x a="&amp;' d="M0 0 L1 -1"/>
+    """
+    from xml.sax.saxutils import quoteattr
+    x0, y0, x1, y1 = _bounds(display_list)
+    left, top = math.floor(x0) - MARGIN, math.floor(-y1) - MARGIN
+    width = math.ceil(x1) - math.floor(x0) + 2 * MARGIN
+    height = math.ceil(y1) - math.floor(y0) + 2 * MARGIN
+    box = 'x="{0}" y="{1}" width="{2}" height="{3}"'.format(
+        left, top, width, height)
+    lines = ['<svg xmlns="http://www.w3.org/2000/svg" width="{0}" '
+             'height="{1}" viewBox="{2} {3} {0} {1}">'.format(
+                 width, height, left, top),
+             '<rect {0} fill="white"/>'.format(box),
+             '<g fill="none" stroke-linecap="round" stroke-linejoin="round">']
+    for kind, color, coords in display_list:
+        if not coords:
+            continue
+        points = _points(_flip(coords), "%.6g %.6g")
+        path = "M" + points[0] + " L" + " ".join(points[1:])
+        if kind == "fill":
+            lines.append('<path fill={0} d="{1} Z"/>'.format(
+                quoteattr(color), path))
+        else:
+            lines.append('<path stroke={0} d="{1}"/>'.format(
+                quoteattr(color), path))
+    lines.append("</g>\n</svg>")
+    return "\n".join(lines)
+
+# PostScript has no color names, so only these and #rgb colors are available
+_RGB = {
+    "black": (0, 0, 0), "white": (1, 1, 1), "red": (1, 0, 0),
+    "green": (0, 0.5, 0), "blue": (0, 0, 1), "yellow": (1, 1, 0),
+    "cyan": (0, 1, 1), "magenta": (1, 0, 1), "orange": (1, 0.65, 0),
+    "purple": (0.5, 0, 0.5), "brown": (0.65, 0.16, 0.16),
+    "gray": (0.5, 0.5, 0.5), "grey": (0.5, 0.5, 0.5), "pink": (1, 0.75, 0.8),
+}
+
+def _rgb(color):
+    """The red, green and blue components of COLOR, from 0 to 1.  Raises
+    ValueError for a color that is neither in _RGB nor hexadecimal.
+
+    >>> _rgb("#ff8000"), _rgb("#f00"), _rgb("Blue")
+    ((1.0, 0.502, 0.0), (1.0, 0.0, 0.0), (0, 0, 1))
+    >>> _rgb("chartreuse")
+    Traceback (most recent call last):
+        ...
+    ValueError: unknown color chartreuse
+    """
+    if color.startswith("#") and len(color) in (4, 7):
+        k = (len(color) - 1) // 3
+        try:
+            return tuple(round(int(color[1+i*k:1+(i+1)*k], 16) / (16**k - 1), 3)
+                         for i in range(3))
+        except ValueError:
+            pass
+    try:
+        return _RGB[color.lower()]
+    except KeyError:
+        raise ValueError("unknown color " + color)
+
+PS_PATH_LENGTH = 1000  # Points per path, within the limits of old printers
+
+def to_postscript(display_list):
+    """Render DISPLAY_LIST as an Encapsulated PostScript document.
+
+    >>> print(to_postscript([("line", "red", [0, 0, 10, 20])]))
+    %!PS-Adobe-3.0 EPSF-3.0
+    %%BoundingBox: 0 0 30 40
+    %%EndComments
+    /m {moveto} bind def /l {lineto} bind def
+    1 setlinecap 1 setlinejoin
+    10 10 translate
+    1 0 0 setrgbcolor
+    0 0 m
+    10 20 l
+    stroke
+    showpage
+    %%EOF
+    """
+    x0, y0, x1, y1 = _bounds(display_list)
+    width = math.ceil(x1) - math.floor(x0) + 2 * MARGIN
+    height = math.ceil(y1) - math.floor(y0) + 2 * MARGIN
+    lines = ["%!PS-Adobe-3.0 EPSF-3.0",
+             "%%BoundingBox: 0 0 {0} {1}".format(width, height),
+             "%%EndComments",
+             "/m {moveto} bind def /l {lineto} bind def",
+             "1 setlinecap 1 setlinejoin",
+             "{0} {1} translate".format(MARGIN - math.floor(x0),
+                                        MARGIN - math.floor(y0))]
+    for kind, color, coords in display_list:
+        if not coords:
+            continue
+        lines.append("%g %g %g setrgbcolor" % _rgb(color))
+        points = _points(coords, "%.6g %.6g")
+        if kind == "fill":
+            lines.append(points[0] + " m")
+            lines.extend(p + " l" for p in points[1:])
+            lines.append("closepath fill")
+            continue
+        for start in range(0, len(points) - 1, PS_PATH_LENGTH):
+            chunk = points[start:start + PS_PATH_LENGTH + 1]
+            lines.append(chunk[0] + " m")
+            lines.extend(p + " l" for p in chunk[1:])
+            lines.append("stroke")
+    lines += ["showpage", "%%EOF"]
+    return "\n".join(lines)
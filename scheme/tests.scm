@@ -570,6 +570,335 @@ one-through-four
 ; expect 4
 
 
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+;;; Vectors and hash tables ;;;
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+
+(define v (make-vector 3 'a))
+v
+; expect #(a a a)
+(vector-set! v 1 '(1 2))
+(vector-ref v 1)
+; expect (1 2)
+(vector-length v)
+; expect 3
+(vector-ref v 3)
+; expect Error
+#(1 (2 3) "s")
+; expect #(1 (2 3) "s")
+(vector? (vector 1 2))
+; expect True
+
+(define t (make-hash-table))
+(hash-set! t '(1 2) 'pair)
+(hash-set! t 'x 10)
+(hash-ref t (list 1 2))
+; expect pair
+(hash-ref t 'y 'none)
+; expect none
+(hash-ref t 'y)
+; expect Error
+(hash-count t)
+; expect 2
+(hash-remove! t 'x)
+t
+; expect #hash(((1 2) . pair))
+(hash-ref '#hash((a . 1) (b . 2)) 'b)
+; expect 2
+
+
+;;;;;;;;;;;;;;;;;;;;;;;
+;;; List primitives ;;;
+;;;;;;;;;;;;;;;;;;;;;;;
+
+(sort '(3 1 4 1 5 9 2 6) <)
+; expect (1 1 2 3 4 5 6 9)
+(sort '((b . 2) (a . 1) (c . 1)) (lambda (x y) (< (cdr x) (cdr y))))
+; expect ((a . 1) (c . 1) (b . 2))
+(sort #(3 2 1) <)
+; expect #(1 2 3)
+(reverse '(1 2 3))
+; expect (3 2 1)
+(list-tail '(1 2 3 4) 2)
+; expect (3 4)
+(list-tail '(1 2) 3)
+; expect Error
+(assoc '(b) '(((a) . 1) ((b) . 2)))
+; expect ((b) . 2)
+(assq 'c '((a . 1) (b . 2)))
+; expect False
+(member 3 '(1 2 3 4))
+; expect (3 4)
+(memq 'z '(x y))
+; expect False
+(list-copy '(1 2 . 3))
+; expect (1 2 . 3)
+(list->vector '(1 2 3))
+; expect #(1 2 3)
+(vector->list #(1 (2) 3))
+; expect (1 (2) 3)
+
+
+;;;;;;;;;;;;;;;;;;;
+;;; Memoization ;;;
+;;;;;;;;;;;;;;;;;;;
+
+(define-memo (count-partitions n m)
+  (cond ((= n 0) 1)
+        ((or (< n 0) (= m 0)) 0)
+        (else (+ (count-partitions (- n m) m)
+                 (count-partitions n (- m 1))))))
+(count-partitions 30 30)
+; expect 5604
+(cdr (assq 'evictions (memo-stats count-partitions)))
+; expect 0
+
+(define (fib n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))
+(define fib (memoize fib 3))
+(fib 60)
+; expect 1548008755920
+(memo-stats fib)
+; expect ((hits . 58) (misses . 61) (evictions . 58) (size . 3))
+(memoize car)
+; expect Error
+(define memo-identity (memoize (lambda (x) x)))
+(list (memo-identity #t) (memo-identity 1) (memo-identity 1.0))
+; expect (True 1 1.0)
+(list (memo-identity '(1)) (memo-identity '(#t)))
+; expect ((1) (True))
+
+
+;;;;;;;;;;;;;;;;;;;;
+;;; Hash consing ;;;
+;;;;;;;;;;;;;;;;;;;;
+
+(set-hash-consing! #t)
+(define table '((a (1 2)) (b (1 2)) (c (1 . 2))))
+(equal? (car (cdr (car table))) (car (cdr (car (cdr table)))))
+; expect True
+(equal? (car (cdr (car table))) (car (cdr (car (cdr (cdr table))))))
+; expect False
+(cons 1 (car (cdr (car table))))
+; expect (1 1 2)
+(set-hash-consing! #f)
+
+
+;;;;;;;;;;;;;;;;;;;;
+;;; Output ports ;;;
+;;;;;;;;;;;;;;;;;;;;
+
+(with-output-to-string (lambda () (display "a") (print '(1 "b" (2 . 3)))))
+; expect "a(1 \"b\" (2 . 3))\n"
+(define p (current-output-port))
+(output-port? p)
+; expect True
+(display 42 p)
+; expect 42okay
+(with-output-to-string (lambda () (display 'x p)))
+; expect x""
+(define out (open-output-file "scheme_test_ports.txt"))
+(display "written" out)
+(newline out)
+(print '(1 2) out)
+(flush-output out)
+(close-output-port out)
+(define in (open-input-file "scheme_test_ports.txt"))
+(read-line in)
+; expect "written"
+(read in)
+; expect (1 2)
+(close-input-port in)
+(delete-file "scheme_test_ports.txt")
+(open-input-file "scheme_test_ports.txt")
+; expect Error
+
+
+;;;;;;;;;;;;;;;;;;;
+;;; Input ports ;;;
+;;;;;;;;;;;;;;;;;;;
+
+(define in (open-input-file "tests.scm"))
+(read-line in)
+; expect ";;; Test cases for Scheme."
+(read-char in)
+; expect ";"
+(peek-char in)
+; expect ";"
+(read in)
+; expect 10
+(read in)
+; expect (+ 137 349)
+(close-input-port in)
+(read in)
+; expect Error
+(eof-object? (eof-object))
+; expect True
+
+
+;;;;;;;;;;;;;;;
+;;; Futures ;;;
+;;;;;;;;;;;;;;;
+
+(define (tri n) (if (= n 0) 0 (+ n (tri (- n 1)))))
+(define offset 1000)
+(define f (future (+ offset (tri 100))))
+(touch f)
+; expect 6050
+(pmap (lambda (n) (cons n (tri n))) '(1 2 3 4))
+; expect ((1 . 1) (2 . 3) (3 . 6) (4 . 10))
+((touch (future (lambda (x) (+ x offset)))) 1)
+; expect 1001
+(touch (future (car '())))
+; expect Error
+
+
+;;;;;;;;;;;;;;;;;;;;;
+;;; Dynamic scope ;;;
+;;;;;;;;;;;;;;;;;;;;;
+
+(define outer (mu (x) (inner (lambda () x) (+ x 1))))
+(define inner (mu (f x) (list (f) x)))
+(outer 5)
+; expect (5 6)
+(define countdown (mu (n) (if (= n 0) (list depth-marker n) (countdown (- n 1)))))
+((lambda (depth-marker) (countdown 100)) 'bottom)
+; expect (bottom 0)
+(define shadow (mu (n) (if (= n 0) n (begin (define n (- n 1)) (shadow n)))))
+(shadow 3)
+; expect 0
+(countdown 1)
+; expect Error
+
+
+;;;;;;;;;;;;;;;;;;;;;
+;;; Flat closures ;;;
+;;;;;;;;;;;;;;;;;;;;;
+
+(define (redefined)
+  (define x 1)
+  (define g (lambda () x))
+  (define x 2)
+  (g))
+(redefined)
+; expect 2
+(define (forward)
+  (define (even n) (if (= n 0) #t (odd (- n 1))))
+  (define (odd n) (if (= n 0) #f (even (- n 1))))
+  (even 10))
+(forward)
+; expect True
+(define (make-adder n) (lambda (x) (+ x n)))
+(define add5 (make-adder 5))
+(define n 100)
+(add5 1)
+; expect 6
+(define (late-global) (lambda () later))
+(define later-thunk (late-global))
+(define later 'defined-later)
+(later-thunk)
+; expect defined-later
+(define (dynamic-outer x) (define m (mu () x)) ((lambda () (m))))
+(dynamic-outer 5)
+; expect 5
+(define evaluate eval)
+(define (eval-alias x) (lambda () (evaluate 'x)))
+((eval-alias 7))
+; expect 7
+(define (malformed) (let (x) x))
+(malformed)
+; expect Error
+(set-hash-consing! #t)
+(define (mk1 y) (lambda (x) (+ x y)))
+(define (mk2 x) (lambda (y) (+ x y)))
+(set-hash-consing! #f)
+((mk2 1) 100)
+; expect 101
+
+
+;;;;;;;;;;;;;;;;;;;;;
+;;; Serialization ;;;
+;;;;;;;;;;;;;;;;;;;;;
+
+(define data (list 1 -2.5 "three" 'four (vector 5 '(6 . 7)) (make-hash-table)))
+(hash-set! (car (list-tail data 5)) 'key '(value))
+(serialize data "scheme_test_data.bin")
+(equal? (deserialize "scheme_test_data.bin") data)
+; expect True
+(delete-file "scheme_test_data.bin")
+(deserialize "tests.scm")
+; expect Error
+
+
+;;;;;;;;;;;;;;;;;;;;;;;;;;;
+;;; Named let and do loops ;;;
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+
+(let loop ((i 0) (total 0))
+  (if (> i 100) total (loop (+ i 1) (+ total i))))
+; expect 5050
+(let fact ((n 5))
+  (if (= n 0) 1 (* n (fact (- n 1)))))
+; expect 120
+(let loop ((i 0))
+  (cond ((= i 3) 'done)
+        ((even? i) (display i) (loop (+ i 1)))
+        (else (loop (+ i 1)))))
+; expect 02done
+(define thunks
+  (let loop ((i 3) (fs nil))
+    (if (= i 0) fs (loop (- i 1) (cons (lambda () i) fs)))))
+(list ((car thunks)) ((car (cdr thunks))))
+; expect (1 2)
+(do ((i 0 (+ i 1)) (acc nil (cons i acc)))
+    ((= i 4) acc))
+; expect (3 2 1 0)
+(do ((vec (make-vector 3)) (i 0 (+ i 1)))
+    ((= i 3) vec)
+  (vector-set! vec i (* i i)))
+; expect #(0 1 4)
+(define thunks
+  (do ((i 0 (+ i 1)) (fs nil (cons (lambda () i) fs)))
+      ((= i 2) fs)))
+(list ((car thunks)) ((car (cdr thunks))))
+; expect (1 0)
+(do ((i 0 (+ i 1))) ((= i 2)))
+; expect okay
+(let loop ((i 0) (i 1)) i)
+; expect Error
+(do ((i 0)) ())
+; expect Error
+
+
+;;;;;;;;;;;;;;;;;;;;;;;
+;;; Turtle graphics ;;;
+;;;;;;;;;;;;;;;;;;;;;;;
+
+(define (square side)
+  (if (> side 0)
+      (begin (repeat 4 (lambda () (fd side) (rt 90)))
+             (square (- side 20)))))
+(define (repeat k f) (if (> k 0) (begin (f) (repeat (- k 1) f))))
+(color "red")
+(square 60)
+(pu) (goto 0 -50) (pd)
+(begin_fill) (circle 50) (end_fill)
+(save-drawing "scheme_test_drawing.svg")
+(define in (open-input-file "scheme_test_drawing.svg"))
+(begin (display (read-line in)) (newline))
+; expect <svg xmlns="http://www.w3.org/2000/svg" width="180" height="180" viewBox="-110 -70 180 180"> ; okay
+(close-port in)
+(delete-file "scheme_test_drawing.svg")
+(save-drawing "scheme_test_drawing.ps")
+(delete-file "scheme_test_drawing.ps")
+(save-drawing "scheme_test_drawing.png")
+; expect Error
+(color 'red)
+; expect Error
+(color "not-a-color")
+; expect Error
+(clear)
+
+
 ;;;;;;;;;;;;;;;;;;;;
 ;;; Extra credit ;;;
 ;;;;;;;;;;;;;;;;;;;;
@@ -1,10 +1,6 @@
 """The ucb module contains functions specific to 61A at UC Berkeley."""
 
-import code
 import functools
-import inspect
-import re
-import signal
 import sys
 
 
@@ -19,7 +15,9 @@ def main(fn):
 
     Use this instead of the typical __name__ == "__main__" predicate.
     """
-    if inspect.stack()[1][0].f_locals['__name__'] == '__main__':
+    # Check the caller's module without inspect.stack, which is slow enough
+    # to dominate startup
+    if sys._getframe(1).f_globals['__name__'] == '__main__':
         args = sys.argv[1:] # Discard the script name from command line
         fn(*args) # Call the main function
     return fn
@@ -58,11 +56,12 @@ def log(message):
     """Print an indented message (used with trace)."""
     if type(message) is not str:
         message = str(message)
-    print(PREFIX + re.sub('\n', '\n' + PREFIX, message))
+    print(PREFIX + message.replace('\n', '\n' + PREFIX))
 
 
 def log_current_line():
     """Print information about the current line of code."""
+    import inspect
     frame = inspect.stack()[1]
     log('Current line: File "{f[1]}", line {f[2]}, in {f[3]}'.format(f=frame))
 
@@ -76,6 +75,10 @@ def interact(msg=None):
       <Control>-Z <Enter> exists the interactive session and returns to normal
       execution.
     """
+    import code
+    import inspect
+    import signal
+
     # use exception trick to pick up the current frame
     try:
         raise None